@@ -11,7 +11,6 @@ from cubic_loader.dmap.schemas import ApiMetadata
 from cubic_loader.dmap.dmap_api import download_from_url
 from cubic_loader.dmap.dmap_api import get_api_results
 from cubic_loader.dmap.dmap_api import ApiResult
-from cubic_loader.utils.postgres import copy_local_to_db
 from cubic_loader.utils.postgres import DatabaseManager
 from cubic_loader.utils.logger import ProcessLogger
 
@@ -176,7 +175,7 @@ def run_api_copy(url: str, destination_table: Any) -> None:
                 # related to a previous processing error
                 drop_dataset_id_null(destination_table, db_manager)
 
-                copy_local_to_db(temp_file_path, destination_table)
+                db_manager.copy_csv(temp_file_path, str(destination_table.__table__), gzipped=True)
 
             db_manager.vaccuum_analyze(destination_table)
 
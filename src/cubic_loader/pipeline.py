@@ -1,10 +1,18 @@
 import os
+from typing import Dict
+from typing import List
+from typing import Tuple
 from multiprocessing import get_context
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from multiprocessing.synchronize import Semaphore
 
 from cubic_loader.utils.aws import check_for_parallel_tasks
 from cubic_loader.utils.logger import ProcessLogger
 from cubic_loader.utils.postgres import alembic_upgrade_to_head
 from cubic_loader.utils.postgres import DatabaseManager
+from cubic_loader.utils.postgres import set_copy_session_semaphore
+from cubic_loader.utils.runtime import env_int
 from cubic_loader.utils.runtime import validate_environment
 from cubic_loader.utils.remote_locations import ODS_SCHEMA
 
@@ -13,6 +21,7 @@ from cubic_loader.dmap.api_copy_job import run_api_copy
 from cubic_loader.dmap.api_job_list import produce_job_list
 
 from cubic_loader.qlik.ods_tables import CUBIC_ODS_TABLES
+from cubic_loader.qlik.ods_tables import CUBIC_ODS_TABLE_WEIGHTS
 from cubic_loader.qlik.ods_qlik import CubicODSQlik
 
 
@@ -44,20 +53,43 @@ def start_dmap() -> None:
             job_log.log_failure(exception)
 
 
-def start_qlik_load() -> None:
+def run_qlik_table_etl(qlik_table: CubicODSQlik, copy_sessions: Semaphore) -> None:
     """
-    Load ODS QLIK tables from S3 Buckets into RDS
+    Entry point of spawned CubicODSQlik process
+
+    :param qlik_table: CubicODSQlik table to run ETL for
+    :param copy_sessions: semaphore capping concurrent COPY sessions across all table processes
+
+    COPY session slots held by killed table processes are never released, so waiting for a slot fails
+    after QLIK_COPY_SESSION_TIMEOUT seconds (0 waits forever) instead of blocking the whole load
     """
-    os.environ["SERVICE_NAME"] = "qlik_loader"
+    set_copy_session_semaphore(copy_sessions, env_int("QLIK_COPY_SESSION_TIMEOUT", 2 * 60 * 60) or None)
+    qlik_table.run_etl()
+
+
+def qlik_table_weight(cubic_table: str, max_workers: int) -> int:
+    """
+    scheduler weight of a CUBIC ODS table, capped at max_workers
+
+    :param cubic_table: Cubic ODS Table Name eg ("EDW.CARD_DIMENSION")
+    :param max_workers: total scheduler weight capacity
+    """
+    return max(1, min(CUBIC_ODS_TABLE_WEIGHTS.get(cubic_table, 1), max_workers))
 
-    for cubic_table in CUBIC_ODS_TABLES:
-        log = ProcessLogger("CubicODSQlik", cubic_table=cubic_table)
 
+def wait_for_qlik_processes(running: Dict[int, Tuple[BaseProcess, ProcessLogger, int]]) -> None:
+    """
+    wait for at least one running CubicODSQlik process to exit and log its exitcode
+
+    finished processes are removed from `running`
+
+    :param running: running processes, keyed by process sentinel
+    """
+    finished: List[int] = wait(list(running.keys()))  # type: ignore
+    for sentinel in finished:
+        proc, log, _ = running.pop(sentinel)
+        proc.join()
         try:
-            qlik_table = CubicODSQlik(cubic_table)
-            proc = get_context("spawn").Process(target=qlik_table.run_etl)
-            proc.start()
-            proc.join()
             if proc.exitcode == 0:
                 log.log_complete()
             else:
@@ -65,6 +97,58 @@ def start_qlik_load() -> None:
         except Exception as exception:
             log.log_failure(exception)
 
+
+def start_qlik_load() -> None:
+    """
+    Load ODS QLIK tables from S3 Buckets into RDS
+
+    Each table is loaded in its own spawned process. Processes are scheduled so that the sum of
+    weights of running tables does not exceed QLIK_MAX_WORKERS. Heavier tables are started first.
+
+    Concurrent COPY sessions across all table processes are capped at QLIK_MAX_COPY_SESSIONS.
+    """
+    os.environ["SERVICE_NAME"] = "qlik_loader"
+
+    max_workers = max(1, env_int("QLIK_MAX_WORKERS", 4))
+    max_copy_sessions = max(1, env_int("QLIK_MAX_COPY_SESSIONS", 4))
+
+    scheduler_log = ProcessLogger(
+        "qlik_load_scheduler",
+        max_workers=max_workers,
+        max_copy_sessions=max_copy_sessions,
+        table_count=len(CUBIC_ODS_TABLES),
+    )
+
+    spawn_context = get_context("spawn")
+    copy_sessions = spawn_context.BoundedSemaphore(max_copy_sessions)
+
+    pending = sorted(CUBIC_ODS_TABLES, key=lambda t: qlik_table_weight(t, max_workers), reverse=True)
+    # running processes keyed by process sentinel
+    running: Dict[int, Tuple[BaseProcess, ProcessLogger, int]] = {}
+
+    while pending or running:
+        running_weight = sum(weight for _, _, weight in running.values())
+        while pending:
+            weight = qlik_table_weight(pending[0], max_workers)
+            if running and running_weight + weight > max_workers:
+                break
+
+            cubic_table = pending.pop(0)
+            log = ProcessLogger("CubicODSQlik", cubic_table=cubic_table, weight=weight)
+            try:
+                qlik_table = CubicODSQlik(cubic_table)
+                proc = spawn_context.Process(target=run_qlik_table_etl, args=(qlik_table, copy_sessions))
+                proc.start()
+                running[proc.sentinel] = (proc, log, weight)
+                running_weight += weight
+            except Exception as exception:
+                log.log_failure(exception)
+
+        if running:
+            wait_for_qlik_processes(running)
+
+    scheduler_log.log_complete()
+
     db = DatabaseManager()
     db.refresh_mat_views(ODS_SCHEMA)
 
@@ -0,0 +1,169 @@
+import os
+import gzip
+import hashlib
+import shutil
+import threading
+from queue import Queue
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Optional
+
+from cubic_loader.utils.aws import s3_get_object
+from cubic_loader.utils.postgres import clean_csv_header
+from cubic_loader.qlik.utils import CDC_DOWNLOAD_BUFFER_BYTES
+from cubic_loader.utils.logger import ProcessLogger
+
+
+def thread_save_csv_file(args: Tuple[str, str]) -> Optional[Tuple[str, int]]:
+    """
+    work to download and partition cdc files
+
+    - read header row from first decompressed chunk, encode it as sha1 hash for foldername
+    - stream-decompress csv.gz as .csv file straight into hash foldername, in CDC_DOWNLOAD_BUFFER_BYTES chunks
+
+    :return: Tuple[local csv path in hash folder, csv bytes] or None if download failed
+    """
+    csv_object, hash_dir = args
+    logger = ProcessLogger("download_cdc_file", csv_object=csv_object)
+
+    csv_local_path = None
+    try:
+        csv_local_file = csv_object.replace("s3://", "").replace("/", "|").replace(".csv.gz", ".csv")
+        with gzip.open(s3_get_object(csv_object), "rb") as r_bytes:
+            header_line = r_bytes.readline()
+            csv_headers = clean_csv_header(header_line.decode("utf8"))
+            hash_folder = hashlib.sha1(csv_headers.encode("utf8")).hexdigest()
+
+            os.makedirs(os.path.join(hash_dir, hash_folder), exist_ok=True)
+            csv_local_path = os.path.join(hash_dir, hash_folder, csv_local_file)
+            with open(csv_local_path, mode="wb") as w_bytes:
+                w_bytes.write(header_line)
+                shutil.copyfileobj(r_bytes, w_bytes, CDC_DOWNLOAD_BUFFER_BYTES)
+                csv_bytes = w_bytes.tell()
+
+        logger.log_complete()
+        return (csv_local_path, csv_bytes)
+
+    except Exception as exception:
+        if csv_local_path is not None and os.path.exists(csv_local_path):
+            os.remove(csv_local_path)
+        logger.log_failure(exception)
+        return None
+
+
+class CDCFolderLoader:  # pylint: disable=too-many-instance-attributes
+    """
+    Load cdc hash folders into RDS on a background thread
+
+    Downloaded cdc files are written straight into their hash folder. Files are only added to a hash
+    folder's load list once all earlier submitted downloads are committed, so each load contains cdc
+    files in timestamp order. Folder sizes are tracked in memory.
+
+    Folders are loaded one at a time, in the order they are queued, while the caller keeps
+    downloading cdc files. Bytes of cdc files on local disk are tracked so downloads can be throttled.
+
+    If loading a folder raises, remaining queued folders are skipped, and the exception is re-raised on
+    the caller thread by the next check_folders, wait_for_load, wait_for_disk or finish call.
+    """
+
+    def __init__(self, load_folder: Callable[[str, List[str]], None]) -> None:
+        """
+        :param load_folder: function loading list of cdc files from one hash folder into RDS
+        """
+        self.load_folder = load_folder
+        self.disk_bytes = 0
+        self.queued_folders = 0
+        self.error: Optional[BaseException] = None
+        self.folders: Dict[str, Tuple[List[str], int]] = {}
+        self.condition = threading.Condition()
+        self.queue: Queue[Optional[Tuple[str, List[str], int]]] = Queue()
+        self.thread = threading.Thread(target=self._run, name="cdc_folder_loader", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        """load queued folders until None is received"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            load_folder, load_files, folder_bytes = item
+            try:
+                if self.error is None:
+                    self.load_folder(load_folder, load_files)
+            # BaseException, so a polars PanicException does not kill the loader thread and leave callers
+            # waiting forever for queued folders
+            except BaseException as exception:  # pylint: disable=broad-exception-caught
+                self.error = exception
+            finally:
+                with self.condition:
+                    self.disk_bytes -= folder_bytes
+                    self.queued_folders -= 1
+                    self.condition.notify_all()
+
+    def add_cdc_file(self, download: Optional[Tuple[str, int]]) -> None:
+        """
+        commit downloaded cdc file to its hash folder load list
+
+        :param download: Tuple[local csv path in hash folder, csv bytes] from thread_save_csv_file
+        """
+        if download is None:
+            return
+        csv_local_path, csv_bytes = download
+        hash_folder = os.path.dirname(csv_local_path)
+        folder_files, folder_bytes = self.folders.get(hash_folder, ([], 0))
+        folder_files.append(csv_local_path)
+        self.folders[hash_folder] = (folder_files, folder_bytes + csv_bytes)
+        with self.condition:
+            self.disk_bytes += csv_bytes
+
+    def check_folders(self, max_folder_bytes: int = 0) -> None:
+        """
+        Check all cdc hash folders
+        if
+            size of hash folder is larger than max_folder_bytes
+            or more than 5000 files in folder
+        then queue committed folder files to be loaded into RDS
+
+        :param max_folder_bytes: folder size threshold to trigger load operation
+        """
+        self.raise_error()
+        for hash_folder, (folder_files, folder_bytes) in list(self.folders.items()):
+            if folder_bytes > max_folder_bytes or len(folder_files) > 5_000:
+                with self.condition:
+                    self.queued_folders += 1
+                self.queue.put((hash_folder, folder_files, folder_bytes))
+                del self.folders[hash_folder]
+
+    def wait_for_load(self) -> None:
+        """block until at least one queued folder has finished loading"""
+        with self.condition:
+            queued_folders = self.queued_folders
+            self.condition.wait_for(lambda: self.queued_folders < queued_folders or self.queued_folders == 0)
+        self.raise_error()
+
+    def wait_for_disk(self, disk_budget: int, reserve_bytes: int = 0) -> None:
+        """
+        load hash folders until reserve_bytes more fit into disk_budget, or no cdc files are left on disk
+
+        :param disk_budget: bytes of cdc files allowed on local disk
+        :param reserve_bytes: bytes to be written to local disk next
+        """
+        self.raise_error()
+        while self.disk_bytes > 0 and self.disk_bytes + reserve_bytes > disk_budget:
+            if self.queued_folders > 0:
+                self.wait_for_load()
+            else:
+                self.check_folders()
+
+    def finish(self) -> None:
+        """load all queued folders and stop loader thread"""
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+    def raise_error(self) -> None:
+        """re-raise exception of failed folder load on caller thread"""
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,183 @@
+from datetime import date
+from datetime import datetime
+from typing import List
+from typing import Optional
+from typing import Set
+
+from dateutil.relativedelta import relativedelta
+
+from cubic_loader.utils.postgres import DatabaseManager
+from cubic_loader.utils.logger import ProcessLogger
+from cubic_loader.qlik.rds_utils import select_partitions
+from cubic_loader.qlik.rds_utils import history_partition_name
+from cubic_loader.qlik.rds_utils import history_partition_month
+from cubic_loader.qlik.rds_utils import history_partitions_for_range
+from cubic_loader.qlik.rds_utils import create_history_partition
+from cubic_loader.qlik.rds_utils import create_history_partition_from_default
+from cubic_loader.qlik.rds_utils import create_history_default_partition
+from cubic_loader.qlik.rds_utils import detach_history_partition
+from cubic_loader.qlik.rds_utils import drop_table
+from cubic_loader.qlik.utils import HISTORY_RETENTION_MONTHS
+from cubic_loader.qlik.utils import HISTORY_RETENTION_ACTION
+
+
+class HistoryPartitionManager:
+    """
+    Create and remove monthly partitions of a HISTORY table
+
+    existing partitions are read from pg_inherits once, then tracked in memory, so partitions are only
+    CREATE'd for months not yet covered
+
+    with a retention policy, months older than the retention cutoff are never CREATE'd, and HISTORY rows
+    of those months are not loaded (see retention_where)
+    """
+
+    def __init__(
+        self,
+        db: DatabaseManager,
+        history_table: str,
+        retention_months: int = HISTORY_RETENTION_MONTHS,
+        retention_action: str = HISTORY_RETENTION_ACTION,
+    ) -> None:
+        """
+        :param db: DatabaseManager of RDS
+        :param history_table: name and schema of HISTORY table as 'schema.table'
+        :param retention_months: number of months of partitions to keep, before the current month, 0 to keep all
+        :param retention_action: "drop" to DETACH and DROP expired partitions, "detach" to only DETACH them,
+            so they can be exported
+        """
+        if retention_action not in ("drop", "detach"):
+            raise ValueError(f"history partition retention action must be 'drop' or 'detach', got '{retention_action}'")
+        self.db = db
+        self.history_table = history_table
+        self.retention_months = retention_months
+        self.retention_action = retention_action
+        self.default_partition = f"{history_table}_default"
+        self.partitions: Set[str] = {
+            row["partition"] for row in self.db.select_as_list(select_partitions(self.history_table))
+        }
+
+    def retention_cutoff(self) -> Optional[date]:
+        """
+        first day of oldest month kept by retention policy, None if all months are kept
+        """
+        if self.retention_months <= 0:
+            return None
+        return date.today().replace(day=1) - relativedelta(months=self.retention_months)
+
+    def retention_where(self) -> str:
+        """
+        SQL condition keeping only HISTORY rows inside of retention policy, "TRUE" if all rows are kept
+        """
+        cutoff = self.retention_cutoff()
+        if cutoff is None:
+            return "TRUE"
+        return f"header__timestamp >= '{cutoff}'"
+
+    def ensure_range(self, min_date: date, max_date: date) -> List[str]:
+        """
+        CREATE monthly partitions covering min_date to max_date that do not exist yet
+
+        months older than retention cutoff are skipped
+        if HISTORY table has a DEFAULT partition, rows of the new month are moved out of it
+
+        :param min_date: first date of range
+        :param max_date: last date of range
+
+        :return: partitions created
+        """
+        created: List[str] = []
+        part_date = max(min_date.replace(day=1), self.retention_cutoff() or date.min)
+        while part_date <= max_date:
+            partition = history_partition_name(self.history_table, part_date)
+            if partition not in self.partitions:
+                if self.default_partition in self.partitions:
+                    with self.db.session_scope() as session:
+                        self.db.execute(
+                            create_history_partition_from_default(
+                                self.history_table, part_date, self.default_partition
+                            ),
+                            session=session,
+                        )
+                else:
+                    self.db.execute(create_history_partition(self.history_table, part_date))
+                self.partitions.add(partition)
+                created.append(partition)
+            part_date += relativedelta(months=1)
+
+        if created:
+            ProcessLogger(
+                "history_partitions_create",
+                table=self.history_table,
+                partitions=",".join(created),
+            ).log_complete()
+
+        return created
+
+    def ensure_snapshot(self, snapshot_ts: str) -> List[str]:
+        """
+        CREATE monthly partition for header__timestamp of snapshot load records, if it does not exist yet
+
+        :param snapshot_ts: snapshot timestamp as YYYYMMDDTHHMMSSZ
+
+        :return: partitions created
+        """
+        snapshot_date = datetime.strptime(snapshot_ts[:8], "%Y%m%d").date()
+        return self.ensure_range(snapshot_date, snapshot_date)
+
+    def ensure_default(self) -> None:
+        """CREATE DEFAULT partition, for rows outside of any monthly partition"""
+        if self.default_partition not in self.partitions:
+            self.db.execute(create_history_default_partition(self.history_table))
+            self.partitions.add(self.default_partition)
+
+    def apply_retention(self) -> List[str]:
+        """
+        remove monthly partitions older than retention cutoff
+
+        DEFAULT partition is never removed, detached partitions are renamed with a `_detached` suffix
+
+        :return: partitions removed
+        """
+        cutoff = self.retention_cutoff()
+        if cutoff is None:
+            return []
+
+        expired = [
+            partition
+            for partition in sorted(self.partitions)
+            if (part_month := history_partition_month(partition)) is not None and part_month < cutoff
+        ]
+        if not expired:
+            return []
+
+        logger = ProcessLogger(
+            "history_partitions_retention",
+            table=self.history_table,
+            retention_months=self.retention_months,
+            action=self.retention_action,
+            partitions=",".join(expired),
+        )
+        for partition in expired:
+            self.db.execute(detach_history_partition(self.history_table, partition))
+            if self.retention_action == "drop":
+                self.db.execute(drop_table(f"{partition}_detached"))
+            self.partitions.discard(partition)
+        logger.log_complete()
+
+        return expired
+
+    def partitions_for_range(self, min_date: date, max_date: date) -> List[str]:
+        """
+        existing monthly partitions covering min_date to max_date
+
+        :param min_date: first date of range
+        :param max_date: last date of range
+
+        :return: partition tables as 'schema.table'
+        """
+        return [
+            partition
+            for partition in history_partitions_for_range(self.history_table, min_date, max_date)
+            if partition in self.partitions
+        ]
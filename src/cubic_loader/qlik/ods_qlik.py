@@ -1,20 +1,29 @@
 import os
-import gzip
 import json
+import time
 import hashlib
-import shutil
 import tempfile
-from itertools import batched
+from datetime import date
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+from typing import Deque
 from typing import List
 from typing import Tuple
 from typing import Optional
+from typing import Set
 from tempfile import NamedTemporaryFile
 from operator import attrgetter
+from concurrent.futures import Future
 from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 
 import polars as pl
+from sqlalchemy.orm import Session
 
 from cubic_loader.utils.aws import s3_list_objects
+from cubic_loader.utils.aws import S3Object
+from cubic_loader.utils.aws import s3_iter_objects
 from cubic_loader.utils.aws import s3_get_object
 from cubic_loader.utils.aws import s3_object_exists
 from cubic_loader.utils.aws import s3_split_object_path
@@ -26,33 +35,67 @@ from cubic_loader.utils.remote_locations import ODS_STATUS
 from cubic_loader.utils.remote_locations import ODS_SCHEMA
 from cubic_loader.utils.remote_locations import ODIN_PROCESSED
 from cubic_loader.utils.postgres import DatabaseManager
-from cubic_loader.utils.postgres import remote_csv_gz_copy
-from cubic_loader.utils.postgres import header_from_csv_gz
+from cubic_loader.utils.postgres import DB_POOL_SIZE
+from cubic_loader.utils.postgres import DB_MAX_OVERFLOW
 from cubic_loader.qlik.rds_utils import create_tables_from_schema
-from cubic_loader.qlik.rds_utils import create_history_table_partitions
+from cubic_loader.qlik.rds_utils import create_index_statements
+from cubic_loader.qlik.rds_utils import drop_fact_index
+from cubic_loader.qlik.rds_utils import history_partition_index_statements
+from cubic_loader.qlik.rds_utils import select_partitions
 from cubic_loader.qlik.rds_utils import add_columns_to_table
 from cubic_loader.qlik.rds_utils import convert_cols_to_string
 from cubic_loader.qlik.rds_utils import drop_table
+from cubic_loader.qlik.rds_utils import create_staging_table
+from cubic_loader.qlik.rds_utils import set_snapshot_header_defaults
+from cubic_loader.qlik.rds_utils import drop_snapshot_header_defaults
 from cubic_loader.qlik.rds_utils import bulk_delete_from_temp
 from cubic_loader.qlik.rds_utils import bulk_update_from_temp
+from cubic_loader.qlik.rds_utils import bulk_update_columns_from_temp
 from cubic_loader.qlik.rds_utils import bulk_insert_from_temp
+from cubic_loader.qlik.rds_utils import merge_from_temp
 from cubic_loader.qlik.utils import key_column_join_type
 from cubic_loader.qlik.utils import DFMDetails
 from cubic_loader.qlik.utils import DFMSchemaFields
 from cubic_loader.qlik.utils import re_get_first
+from cubic_loader.qlik.cdc_download import CDCFolderLoader
+from cubic_loader.qlik.cdc_download import thread_save_csv_file
+from cubic_loader.qlik.history_partitions import HistoryPartitionManager
 from cubic_loader.qlik.utils import RE_SNAPSHOT_TS
 from cubic_loader.qlik.utils import CDC_COLUMNS
+from cubic_loader.qlik.utils import CDC_UPDATE_PER_COLUMN
+from cubic_loader.qlik.utils import CDC_UPDATE_WORKERS
+from cubic_loader.qlik.utils import CDC_DISK_BUDGET_BYTES
+from cubic_loader.qlik.utils import CDC_DOWNLOAD_INFLIGHT_BYTES
+from cubic_loader.qlik.utils import CDC_DOWNLOAD_SIZE_RATIO
+from cubic_loader.qlik.utils import SNAPSHOT_COPY_WORKERS
+from cubic_loader.qlik.utils import SNAPSHOT_INDEX_WORKERS
+from cubic_loader.qlik.utils import SNAPSHOT_INDEX_PER_PARTITION
+from cubic_loader.qlik.utils import SNAPSHOT_INDEX_MAINTENANCE_WORK_MEM
+from cubic_loader.qlik.utils import CDC_MERGE_FILES
+from cubic_loader.qlik.utils import CDC_APPLY_ENGINE
+from cubic_loader.qlik.utils import VACUUM_DEAD_TUPLE_PCT
+from cubic_loader.qlik.utils import HISTORY_DEFAULT_PARTITION
+from cubic_loader.qlik.utils import cdc_date_range
+from cubic_loader.qlik.utils import ANALYZE_MODIFIED_PCT
 from cubic_loader.qlik.utils import MERGED_FNAME
+from cubic_loader.qlik.utils import CDC_CACHE_FNAME
 from cubic_loader.qlik.utils import RE_CDC_TS
 from cubic_loader.qlik.utils import TableStatus
+from cubic_loader.qlik.utils import get_cdc_gz_csvs
+from cubic_loader.qlik.utils import cdc_listing_manifest_path
 from cubic_loader.qlik.utils import threading_cpu_count
 from cubic_loader.qlik.utils import merge_cdc_csv_gz_files
 from cubic_loader.qlik.utils import dfm_schema_to_json
+from cubic_loader.qlik.utils import dfm_columns_text
+from cubic_loader.qlik.utils import DFM_CACHE_SIZE
 from cubic_loader.qlik.utils import status_schema_to_df
 from cubic_loader.qlik.utils import dfm_schema_to_df
 from cubic_loader.qlik.utils import lf_from_merged_csv
-from cubic_loader.qlik.utils import s3_list_cdc_gz_objects
+from cubic_loader.qlik.utils import cache_cdc_lf
+from cubic_loader.qlik.utils import cdc_final_state_lf
+from cubic_loader.qlik.utils import cdc_latest_updates_lf
 from cubic_loader.utils.logger import ProcessLogger
+from cubic_loader.utils.runtime import peak_rss_mb
 
 
 def get_snapshot_dfms(table: str) -> List[DFMDetails]:
@@ -68,53 +111,13 @@ def get_snapshot_dfms(table: str) -> List[DFMDetails]:
     return sorted(found_snapshots, key=attrgetter("ts"))
 
 
-def get_cdc_gz_csvs(etl_status: TableStatus, table: str) -> List[str]:
-    """
-    find all available CDC csv.gz files for a Snapshot from Archive and Error buckets
-    :param etl_status: status of ETL operation
-    :param table: CUBIC Table Name
-
-    :return: List of ChangeFile objects sorted by 'ts' (Ascending)
-    """
-    table_prefix = os.path.join(ODIN_PROCESSED, QLIK, f"{table}__ct/")
-    snapshot_prefix = f"{table_prefix}snapshot={etl_status.current_snapshot_ts}/"
-
-    cdc_csvs = s3_list_cdc_gz_objects(S3_ARCHIVE, snapshot_prefix, min_ts=etl_status.last_cdc_ts)
-
-    return sorted(cdc_csvs, key=lambda l: re_get_first(l, RE_CDC_TS))
-
-
-def thread_save_csv_file(args: Tuple[str, str]) -> None:
-    """
-    work to download and partition cdc files
-
-    - save csv.gz as .csv file to tmp_folder
-    - encode header row as sha1 hash for foldername
-    - move file into hash foldername
-    """
-    csv_object, tmp_dir = args
-    logger = ProcessLogger("download_cdc_file", csv_object=csv_object)
-
-    try:
-        csv_local_file = csv_object.replace("s3://", "").replace("/", "|").replace(".csv.gz", ".csv")
-        csv_local_path = os.path.join(tmp_dir, csv_local_file)
-        with gzip.open(s3_get_object(csv_object), "rb") as r_bytes:
-            with open(csv_local_path, mode="wb") as w_bytes:
-                w_bytes.write(r_bytes.read())
-
-        csv_headers = header_from_csv_gz(csv_local_path)
-        hash_folder = os.path.join(tmp_dir, hashlib.sha1(csv_headers.encode("utf8")).hexdigest())
+def get_snapshot_parts(snapshot_dfm: DFMDetails) -> List[S3Object]:
+    """find all csv.gz part files of a snapshot, from folder of snapshot dfm file"""
+    bucket, prefix = s3_split_object_path(snapshot_dfm.path.rsplit("/", maxsplit=1)[0])
+    return [obj for obj in s3_iter_objects(bucket, prefix) if obj.size > 0 and ".csv.gz" in obj.key]
 
-        os.makedirs(hash_folder, exist_ok=True)
-        os.rename(csv_local_path, os.path.join(hash_folder, csv_local_file))
 
-        logger.log_complete()
-
-    except Exception as exception:
-        logger.log_failure(exception)
-
-
-# pylint: disable=too-many-instance-attributes
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
 class CubicODSQlik:
     """
     manager class for loading operations of Cubic ODS Qlik tables
@@ -133,6 +136,7 @@ class CubicODSQlik:
         self.s3_snapshot_dfms = get_snapshot_dfms(table)
         self.last_s3_snapshot_dfm = self.s3_snapshot_dfms[-1]
         self.etl_status = self.load_etl_status()
+        self.verified_schemas: Set[str] = set()
 
     def update_status(
         self,
@@ -186,39 +190,121 @@ class CubicODSQlik:
             f.flush()
             s3_upload_file(f.name, self.status_path)
 
+    def snapshot_copy_parts(self, load_table: str) -> int:
+        """
+        COPY all csv.gz parts of snapshot folder into load_table, concurrently over
+        SNAPSHOT_COPY_WORKERS db connections (capped at db connection pool size)
+
+        progress is logged as each part completes, as rows and compressed bytes per second
+
+        :param load_table: table to COPY snapshot parts into
+
+        :return: number of rows copied
+        """
+        snapshot_parts = get_snapshot_parts(self.last_s3_snapshot_dfm)
+        max_workers = max(1, min(SNAPSHOT_COPY_WORKERS, DB_POOL_SIZE + DB_MAX_OVERFLOW))
+        copy_log = ProcessLogger(
+            "snapshot_copy_parts",
+            table=load_table,
+            parts=len(snapshot_parts),
+            parts_bytes=sum(obj.size for obj in snapshot_parts),
+            max_workers=max_workers,
+        )
+        try:
+            start_time = time.monotonic()
+            copied_rows = 0
+            copied_bytes = 0
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                copies = {pool.submit(self.db.copy_csv, obj.path, load_table): obj for obj in snapshot_parts}
+                for parts_done, copy in enumerate(as_completed(copies), start=1):
+                    copied_rows += copy.result()
+                    copied_bytes += copies[copy].size
+                    duration = max(time.monotonic() - start_time, 0.001)
+                    copy_log.add_metadata(
+                        parts_done=parts_done,
+                        rows=copied_rows,
+                        rows_per_sec=int(copied_rows / duration),
+                        bytes=copied_bytes,
+                        bytes_per_sec=int(copied_bytes / duration),
+                    )
+            copy_log.log_complete()
+            return copied_rows
+
+        except Exception as exception:
+            copy_log.log_failure(exception)
+            raise
+
+    def build_index(self, index_statement: str) -> None:
+        """
+        run CREATE INDEX statement in its own transaction with SNAPSHOT_INDEX_MAINTENANCE_WORK_MEM
+
+        :param index_statement: CREATE INDEX statement(s)
+        """
+        index_log = ProcessLogger("build_index", table=self.db_fact_table, index_statement=index_statement)
+        try:
+            with self.db.session_scope() as session:
+                self.db.execute(f"SET LOCAL maintenance_work_mem = '{SNAPSHOT_INDEX_MAINTENANCE_WORK_MEM}';", session)
+                self.db.execute(index_statement, session)
+            index_log.log_complete()
+
+        except Exception as exception:
+            index_log.log_failure(exception)
+            raise
+
+    def snapshot_build_indexes(self) -> None:
+        """
+        build FACT and HISTORY table indexes after snapshot bulk load, on up to SNAPSHOT_INDEX_WORKERS
+        db connections at once
+
+        if SNAPSHOT_INDEX_PER_PARTITION is set, the HISTORY table index is built one partition at a time,
+        concurrently, and partition indexes are attached to parent index
+        """
+        index_statements = create_index_statements(self.etl_status.last_schema, self.db_fact_table)
+        if SNAPSHOT_INDEX_PER_PARTITION:
+            partitions = [row["partition"] for row in self.db.select_as_list(select_partitions(self.db_history_table))]
+            parent_statement, partition_statements = history_partition_index_statements(
+                self.etl_status.last_schema, self.db_fact_table, partitions
+            )
+            self.db.execute(parent_statement)
+            index_statements = index_statements[:1] + partition_statements
+
+        max_workers = max(1, min(SNAPSHOT_INDEX_WORKERS, DB_POOL_SIZE + DB_MAX_OVERFLOW))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for index_build in [pool.submit(self.build_index, statement) for statement in index_statements]:
+                index_build.result()
+
     def rds_snapshot_load(self) -> None:
         """Perform load of initial load files to history table"""
-        # Create _history partitions to cover header__timestamp values of initial load
-        self.db.execute(create_history_table_partitions(self.db_history_table, self.last_s3_snapshot_dfm.ts))
+        # Create _history partition to cover header__timestamp value of initial load
+        self.history_partitions.ensure_snapshot(self.last_s3_snapshot_dfm.ts)
+        # FACT table is only TRUNCATED by snapshot_reset, drop its index so bulk INSERT does not maintain it
+        self.db.execute(drop_fact_index(self.db_fact_table))
 
         # Load all csv.gz files from snapshot folder into _load table
-        bucket, prefix = s3_split_object_path(self.last_s3_snapshot_dfm.path.rsplit("/", maxsplit=1)[0])
-        for s3_path in s3_list_objects(bucket, prefix, in_filter=".csv.gz"):
-            remote_csv_gz_copy(s3_path, f"{self.db_fact_table}_load")
-
-        # update header__ columns in _load table
-        load_update = (
-            f"UPDATE {self.db_fact_table}_load "
-            f"SET header__timestamp=to_timestamp('{self.last_s3_snapshot_dfm.ts}','YYYYMMDDTHHMISSZ') "
-            f", header__change_oper='L' "
-            f", header__change_seq=rpad(regexp_replace('{self.last_s3_snapshot_dfm.ts}','\\D','','g'),35,'0')::numeric "
-            f"WHERE header__timestamp IS NULL;"
-        )
-        self.db.execute(load_update)
+        # header__ columns, not in snapshot files, are set by column defaults during COPY
+        load_table = f"{self.db_fact_table}_load"
+        self.db.execute(set_snapshot_header_defaults(load_table, self.last_s3_snapshot_dfm.ts))
+        try:
+            self.snapshot_copy_parts(load_table)
+        finally:
+            self.db.execute(drop_snapshot_header_defaults(load_table))
 
         # Load records from _load table into _history table
-        history_table_copy = f"INSERT INTO {self.db_history_table} SELECT * FROM {self.db_fact_table}_load;"
+        history_table_copy = (
+            f"INSERT INTO {self.db_history_table} SELECT * FROM {load_table} "
+            f"WHERE {self.history_partitions.retention_where()};"
+        )
         self.db.execute(history_table_copy)
-        self.db.vaccuum_analyze(f"{self.db_history_table}")
 
         # Load records from _load table into fact table
         table_columns = [col["name"] for col in self.etl_status.last_schema]
         table_column_str = ",".join(table_columns)
         fact_table_copy = (
-            f"INSERT INTO {self.db_fact_table} ({table_column_str}) "
-            f"SELECT {table_column_str} FROM {self.db_fact_table}_load;"
+            f"INSERT INTO {self.db_fact_table} ({table_column_str}) " f"SELECT {table_column_str} FROM {load_table};"
         )
         self.db.execute(fact_table_copy)
+        self.snapshot_build_indexes()
+        self.db.vaccuum_analyze(f"{self.db_history_table}")
         self.db.vaccuum_analyze(f"{self.db_fact_table}")
 
         self.update_status(
@@ -236,8 +322,13 @@ class CubicODSQlik:
 
         If column dimension changed (such as Type or Primary Key designation) raise Error
 
+        Verification is skipped if dfm_object columns were already verified against current status schema
+
         :param dfm_object: S3 path of .dfm file that wil be used for verification
         """
+        if self.schema_verify_key(dfm_object) in self.verified_schemas:
+            return
+
         cdc_schema = dfm_schema_to_df(dfm_object)
 
         # check dfm schema contains CDC_COLUMNS
@@ -288,65 +379,219 @@ class CubicODSQlik:
         assert len(dimension_print) == 0, f"dimension change in {dfm_object} -> {','.join(dimension_print)}"
 
         add_columns: List[DFMSchemaFields] = cdc_schema.join(truth_schema, on="name", how="anti").to_dicts()  # type: ignore
-        if len(add_columns) == 0:
-            return
+        if add_columns:
+            self.db.execute(add_columns_to_table(add_columns, self.db_fact_table))
+            current_schema = self.etl_status.last_schema
+            for column in add_columns:
+                current_schema.append(column)
+            self.update_status(last_schema=current_schema)
+
+        if len(self.verified_schemas) >= DFM_CACHE_SIZE:
+            self.verified_schemas.clear()
+        self.verified_schemas.add(self.schema_verify_key(dfm_object))
+
+    def schema_verify_key(self, dfm_object: str) -> str:
+        """
+        key of dfm_object columns content and current status schema, for caching verification results
+
+        :param dfm_object: S3 path of .dfm file
+        """
+        key_text = dfm_columns_text(dfm_object) + json.dumps(self.etl_status.last_schema, sort_keys=True)
+        return hashlib.sha1(key_text.encode("utf8")).hexdigest()
+
+    @contextmanager
+    def staging_table(self, suffix: str, session: Session) -> Iterator[str]:
+        """
+        create session TEMP staging table, with columns of self.db_fact_table load table, for one cdc phase
+        staging table is private to session connection, and DROPPED when context exits without error or
+        on COMMIT, a left over staging table is replaced the next time it is created
+
+        staging data is not written to WAL, and needs no TRUNCATE or VACUUM before re-use
 
-        self.db.execute(add_columns_to_table(add_columns, self.db_fact_table))
-        current_schema = self.etl_status.last_schema
-        for column in add_columns:
-            current_schema.append(column)
-        self.update_status(last_schema=current_schema)
+        :param suffix: phase (or column) specific suffix of staging table name
+        :param session: session from DatabaseManager.session_scope that staging table is used in
 
-    def cdc_update(self, cdc_lf: pl.LazyFrame, tmp_table: str, key_columns: List[str]) -> None:
+        :return: staging table name
+        """
+        staging_table = f"pg_temp.{self.db_fact_table.split('.')[-1]}_stg_{suffix}"
+        self.db.execute(create_staging_table(f"{self.db_fact_table}_load", staging_table), session)
+        yield staging_table
+        self.db.execute(drop_table(staging_table), session)
+
+    def cdc_update(self, cdc_lf: pl.LazyFrame, op_and_key: List[Tuple[str, str]], session: Session) -> None:
         """
         Perform UPDATE from cdc dataframe
+
+        latest non-null value of every non-key column is found per key in one pass,
+        loaded once, and applied to fact table with a single UPDATE statement
+        """
+        if CDC_UPDATE_PER_COLUMN:
+            self.cdc_update_per_column(cdc_lf, "update", op_and_key, session)
+            return
+
+        update_lf, update_cols = cdc_latest_updates_lf(cdc_lf, [column for _, column in op_and_key])
+        if not update_cols:
+            return
+
+        update_row_count = update_lf.select(pl.len()).collect().item()
+        if update_row_count == 0:
+            return
+
+        update_log = ProcessLogger(
+            "cdc_update_columns",
+            table=self.db_fact_table,
+            update_columns=len(update_cols),
+            update_rows=update_row_count,
+        )
+
+        try:
+            self.cdc_update_rows(update_lf, update_cols, op_and_key, session)
+            update_log.log_complete()
+
+        except Exception as exception:
+            update_log.log_failure(exception)
+            raise
+
+    def cdc_update_rows(
+        self, update_lf: pl.LazyFrame, update_cols: List[str], op_and_key: List[Tuple[str, str]], session: Session
+    ) -> None:
+        """
+        COPY latest UPDATE values (from cdc_latest_updates_lf) into staging table and apply them to
+        fact table with a single UPDATE statement
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir, self.staging_table("update", session) as tmp_table:
+            update_csv_path = os.path.join(tmp_dir, "update.csv")
+            update_lf.sink_csv(update_csv_path, quote_style="necessary")
+            self.db.copy_csv(update_csv_path, tmp_table, session=session)
+            update_q = bulk_update_columns_from_temp(self.db_fact_table, tmp_table, update_cols, op_and_key)
+            self.db.execute(update_q, session)
+
+    def cdc_update_column(
+        self,
+        cdc_lf: pl.LazyFrame,
+        update_col: str,
+        staging_suffix: str,
+        op_and_key: List[Tuple[str, str]],
+        session: Session,
+    ) -> None:
+        """
+        Perform UPDATE of a single column from cdc dataframe, through its own staging table
         """
+        key_columns = [column for _, column in op_and_key]
+        update_lf = (
+            cdc_lf.filter(
+                pl.col("header__change_oper").eq("U"),
+                pl.col(update_col).is_not_null(),
+            )
+            .sort(by="header__change_seq", descending=True)
+            .unique(key_columns, keep="first")
+            .select(key_columns + [update_col])
+        )
+        update_row_count = update_lf.select(pl.len()).collect().item()
+        if update_row_count == 0:
+            return
+
+        update_log = ProcessLogger(
+            "cdc_update_column",
+            table=self.db_fact_table,
+            update_column=update_col,
+            update_rows=update_row_count,
+        )
+
+        try:
+            with (
+                tempfile.TemporaryDirectory() as tmp_dir,
+                self.staging_table(staging_suffix, session) as column_table,
+            ):
+                update_csv_path = os.path.join(tmp_dir, "update.csv")
+                update_lf.sink_csv(update_csv_path, quote_style="necessary")
+                self.db.copy_csv(update_csv_path, column_table, session=session)
+                update_q = bulk_update_from_temp(self.db_fact_table, column_table, update_col, op_and_key)
+                self.db.execute(update_q, session)
+            update_log.log_complete()
+
+        except Exception as exception:
+            update_log.log_failure(exception)
+            raise
+
+    def cdc_update_per_column(
+        self, cdc_lf: pl.LazyFrame, tmp_table_suffix: str, op_and_key: List[Tuple[str, str]], session: Session
+    ) -> None:
+        """
+        Perform UPDATE from cdc dataframe, one column at a time
+
+        each column is loaded through its own staging table
+        """
+        key_columns = [column for _, column in op_and_key]
         # Perform UPDATE Operations on fact table for each column indivduallly
-        for update_col in cdc_lf.collect_schema().names():
+        for column_num, update_col in enumerate(cdc_lf.collect_schema().names()):
             if update_col in key_columns or update_col in CDC_COLUMNS:
                 continue
+            self.cdc_update_column(cdc_lf, update_col, f"{tmp_table_suffix}_{column_num}", op_and_key, session)
 
-            update_lf = (
-                cdc_lf.filter(
-                    pl.col("header__change_oper").eq("U"),
-                    pl.col(update_col).is_not_null(),
-                )
-                .sort(by="header__change_seq", descending=True)
-                .unique(key_columns, keep="first")
-                .select(key_columns + [update_col])
-            )
-            update_row_count = update_lf.select(pl.len()).collect().item()
-            if update_row_count == 0:
-                continue
+    def cdc_update_key_range(
+        self, update_lf: pl.LazyFrame, update_cols: List[str], op_and_key: List[Tuple[str, str]]
+    ) -> None:
+        """
+        Perform UPDATE of one key range in its own transaction, on its own db connection
+        """
+        with self.db.session_scope() as session:
+            self.cdc_update_rows(update_lf, update_cols, op_and_key, session)
 
-            update_log = ProcessLogger(
-                "cdc_update_column",
-                table=self.db_fact_table,
-                update_column=update_col,
-                update_rows=update_row_count,
-                tmp_table=tmp_table,
-            )
+    def cdc_update_parallel(self, cdc_lf: pl.LazyFrame, op_and_key: List[Tuple[str, str]]) -> None:
+        """
+        Perform UPDATE from cdc dataframe, with keys split into disjoint key ranges across
+        CDC_UPDATE_WORKERS db connections (capped at db connection pool size)
 
-            try:
-                with tempfile.TemporaryDirectory() as tmp_dir:
-                    update_csv_path = os.path.join(tmp_dir, "update.csv")
-                    update_lf.sink_csv(update_csv_path, quote_style="necessary")
-                    self.db.truncate_table(tmp_table)
-                    remote_csv_gz_copy(update_csv_path, tmp_table)
+        key ranges share no rows, so workers never wait on each others row locks, and the multi-column
+        UPDATE leaves one new row version per key, applying UPDATES again (on retry) has the same result
+
+        all columns of a key range are set by one UPDATE statement, so there is no per-column timing,
+        the number of keys updated per column is logged instead (QLIK_CDC_UPDATE_PER_COLUMN logs timing
+        of every column)
+        """
+        key_columns = [column for _, column in op_and_key]
+        update_lf, update_cols = cdc_latest_updates_lf(cdc_lf, key_columns)
+        if not update_cols:
+            return
 
-                op_and_key = key_column_join_type(update_lf, key_columns)
-                update_q = bulk_update_from_temp(self.db_fact_table, update_col, op_and_key)
-                self.db.execute(update_q)
-                update_log.log_complete()
+        max_workers = max(1, min(CDC_UPDATE_WORKERS, DB_POOL_SIZE + DB_MAX_OVERFLOW))
+        update_df = update_lf.with_columns(
+            (pl.struct(key_columns).hash() % max_workers).alias("key_range"),
+        ).collect()
+        if update_df.height == 0:
+            return
+
+        update_log = ProcessLogger(
+            "cdc_update_parallel",
+            table=self.db_fact_table,
+            update_columns=len(update_cols),
+            update_rows=update_df.height,
+            max_workers=max_workers,
+            column_update_rows=",".join(
+                f"{column}:{count}"
+                for column, count in update_df.select(update_cols).count().row(0, named=True).items()
+            ),
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [
+                    pool.submit(self.cdc_update_key_range, key_range.lazy(), update_cols, op_and_key)
+                    for key_range in update_df.partition_by("key_range", include_key=False)
+                ]
+                for future in futures:
+                    future.result()
+            update_log.log_complete()
 
-            except Exception as exception:
-                update_log.log_failure(exception)
-                raise
+        except Exception as exception:
+            update_log.log_failure(exception)
+            raise
 
-    def cdc_delete(self, cdc_lf: pl.LazyFrame, tmp_table: str, key_columns: List[str]) -> None:
+    def cdc_delete(self, cdc_lf: pl.LazyFrame, op_and_key: List[Tuple[str, str]], session: Session) -> None:
         """
         Perform DELETE from cdc dataframe
         """
+        key_columns = [column for _, column in op_and_key]
         delete_lf = (
             cdc_lf.sort(by="header__change_seq", descending=True)
             .unique(key_columns, keep="first")
@@ -356,17 +601,13 @@ class CubicODSQlik:
         if delete_lf.select(pl.len()).collect().item() == 0:
             return
 
-        op_and_key = key_column_join_type(delete_lf, key_columns)
-        delete_q = bulk_delete_from_temp(self.db_fact_table, op_and_key)
-
-        with tempfile.TemporaryDirectory() as tmp_dir:
+        with tempfile.TemporaryDirectory() as tmp_dir, self.staging_table("delete", session) as tmp_table:
             delete_csv_path = os.path.join(tmp_dir, "delete.csv")
             delete_lf.sink_csv(delete_csv_path, quote_style="necessary")
-            self.db.truncate_table(tmp_table)
-            remote_csv_gz_copy(delete_csv_path, tmp_table)
-        self.db.execute(delete_q)
+            self.db.copy_csv(delete_csv_path, tmp_table, session=session)
+            self.db.execute(bulk_delete_from_temp(self.db_fact_table, tmp_table, op_and_key), session)
 
-    def cdc_insert(self, cdc_lf: pl.LazyFrame, tmp_table: str) -> None:
+    def cdc_insert(self, cdc_lf: pl.LazyFrame, session: Session) -> None:
         """
         Perform INSERT from cdc dataframe
         """
@@ -379,76 +620,202 @@ class CubicODSQlik:
             "cdc_insert_rows",
             table=self.db_fact_table,
             insert_rows=insert_row_count,
-            tmp_table=tmp_table,
         )
-        insert_q = bulk_insert_from_temp(self.db_fact_table, tmp_table, insert_lf.collect_schema().names())
         try:
-            with tempfile.TemporaryDirectory() as tmp_dir:
+            with tempfile.TemporaryDirectory() as tmp_dir, self.staging_table("insert", session) as tmp_table:
                 insert_path = os.path.join(tmp_dir, "insert.csv")
                 insert_lf.sink_csv(insert_path, quote_style="necessary")
-                self.db.truncate_table(tmp_table)
-                remote_csv_gz_copy(insert_path, tmp_table)
-            self.db.execute(insert_q)
+                self.db.copy_csv(insert_path, tmp_table, session=session)
+                self.db.execute(
+                    bulk_insert_from_temp(self.db_fact_table, tmp_table, insert_lf.collect_schema().names()),
+                    session,
+                )
             insert_log.log_complete()
 
         except Exception as exception:
             insert_log.log_failure(exception)
             raise
 
-    def cdc_load_folder(self, load_folder: str) -> None:
+    def cdc_merge(self, cdc_lf: pl.LazyFrame, op_and_key: List[Tuple[str, str]], session: Session) -> None:
         """
-        load all cdc.csv.gz file from load_folder into RDS
+        Perform INSERT, UPDATE and DELETE from cdc dataframe with a single MERGE statement
 
-        1. Merge all csv.gz files into one MERGED_FNAME csv file
-        2. Verify SCHEMA of MERGED_FNAME matches RDS tables
-        3. Load MERGED_FNAME csv file into self.db_history_table table
-        4. Load INSERT records from MERGED_FNAME into self.db_fact_table
-        5. For each non-key column of MERGED_FNAME, load UPDATE records into self.db_fact_table
-        6. Perform DELETE operataions from MERGED_FNAME on self.db_fact_table
-        7. Delete load_folder folder
-
-        :param load_folder: folder containing all csv.gz files to be loaded
+        cdc dataframe is reduced to one final state record per key before loading
         """
-        folder_files = os.listdir(load_folder)
-        logger = ProcessLogger(
-            "cdc_load_folder",
-            load_folder=load_folder,
+        merge_lf = cdc_final_state_lf(cdc_lf, [column for _, column in op_and_key])
+        merge_row_count = merge_lf.select(pl.len()).collect().item()
+        if merge_row_count == 0:
+            return
+
+        merge_log = ProcessLogger(
+            "cdc_merge_rows",
             table=self.db_fact_table,
-            file_count=len(folder_files),
+            merge_rows=merge_row_count,
         )
+        merge_columns = [col for col in merge_lf.collect_schema().names() if col not in CDC_COLUMNS]
         try:
-            dfm_object = folder_files[0].replace(".csv", ".dfm").replace("|", "/")
-            merge_csv = os.path.join(load_folder, MERGED_FNAME)
-            key_columns = [col["name"].lower() for col in self.etl_status.last_schema if col["primaryKeyPos"] > 0]
-            load_table = f"{self.db_fact_table}_load"
+            with tempfile.TemporaryDirectory() as tmp_dir, self.staging_table("merge", session) as tmp_table:
+                merge_path = os.path.join(tmp_dir, "merge.csv")
+                merge_lf.sink_csv(merge_path, quote_style="necessary")
+                self.db.copy_csv(merge_path, tmp_table, session=session)
+                self.db.execute(merge_from_temp(self.db_fact_table, tmp_table, merge_columns, op_and_key), session)
+            merge_log.log_complete()
 
-            cdc_ts = merge_cdc_csv_gz_files(load_folder)
-            self.cdc_verify_schema(dfm_object)
-            cdc_lf = lf_from_merged_csv(merge_csv, dfm_object)
+        except Exception as exception:
+            merge_log.log_failure(exception)
+            raise
+
+    def cdc_apply_phased(
+        self, cdc_lf: pl.LazyFrame, op_and_key: List[Tuple[str, str]], load_folder: str, session: Session
+    ) -> None:
+        """
+        Perform INSERT, UPDATE and DELETE from cdc dataframe as separate phases
+        """
+        insert_phase_log = ProcessLogger("cdc_insert_phase", table=self.db_fact_table, load_folder=load_folder)
+        self.cdc_insert(cdc_lf, session)
+        insert_phase_log.log_complete()
+
+        update_phase_log = ProcessLogger("cdc_update_phase", table=self.db_fact_table, load_folder=load_folder)
+        if CDC_UPDATE_WORKERS > 1:
+            # cdc_update_parallel applied UPDATES before this transaction started, keys INSERTED by this
+            # load folder did not exist yet, so only their UPDATES are applied here
+            key_columns = [column for _, column in op_and_key]
+            inserted_lf = cdc_lf.filter(pl.col("header__change_oper").eq("I").any().over(key_columns))
+            self.cdc_update(inserted_lf, op_and_key, session)
+        else:
+            self.cdc_update(cdc_lf, op_and_key, session)
+        update_phase_log.log_complete()
 
-            # Load records into _history table
+        delete_phase_log = ProcessLogger("cdc_delete_phase", table=self.db_fact_table, load_folder=load_folder)
+        self.cdc_delete(cdc_lf, op_and_key, session)
+        delete_phase_log.log_complete()
+
+    def cdc_table_maintenance(self, date_range: Optional[Tuple[date, date]]) -> None:
+        """
+        RUN VACUUM (ANALYZE) or ANALYZE, only when needed, on self.db_fact_table and the
+        self.db_history_table partitions touched by a load folder
+
+        thresholds are set by VACUUM_DEAD_TUPLE_PCT and ANALYZE_MODIFIED_PCT
+
+        :param date_range: header__timestamp date range of load folder, from cdc_date_range
+        """
+        tables = [self.db_fact_table]
+        if date_range is not None:
+            tables += self.history_partitions.partitions_for_range(*date_range)
+        for table in tables:
+            self.db.maintain_table(
+                table,
+                vacuum_dead_pct=VACUUM_DEAD_TUPLE_PCT,
+                analyze_modified_pct=ANALYZE_MODIFIED_PCT,
+            )
+
+    def cdc_apply_folder(
+        self, cdc_lf: pl.LazyFrame, cdc_csvs: List[str], op_and_key: List[Tuple[str, str]], load_folder: str
+    ) -> None:
+        """
+        apply cdc records of load folder to self.db_history_table and self.db_fact_table
+
+        history COPY and fact INSERT, UPDATE and DELETE (or MERGE) are run on one pooled connection,
+        in one transaction, so a failure leaves no partially applied load folder
+
+        if CDC_UPDATE_WORKERS is more than 1, fact UPDATES of the phased engine are applied by
+        cdc_update_parallel, and committed, before that transaction starts, if the transaction then fails,
+        fact table keeps those UPDATES without their history records until the load folder is retried,
+        cdc_load_folder re-raises the failure so the load folder is retried by the next run, UPDATE values
+        are the latest value per key so the retry applies them again with the same result
+
+        cdc files are COPY'd straight into self.db_history_table, only fact INSERT/UPDATE/DELETE
+        records are COPY'd into session TEMP staging tables
+
+        :param cdc_lf: cdc records of load folder
+        :param cdc_csvs: local csv files of load folder
+        :param op_and_key: join operator and key column pairs
+        :param load_folder: folder containing csv.gz files being loaded
+        """
+        if CDC_APPLY_ENGINE != "merge" and CDC_UPDATE_WORKERS > 1:
+            self.cdc_update_parallel(cdc_lf, op_and_key)
+
+        with self.db.session_scope() as session:
             history_log = ProcessLogger(
                 "cdc_history_copy",
                 table=self.db_fact_table,
                 load_folder=load_folder,
-                tmp_table=load_table,
             )
-            self.db.truncate_table(load_table)
-            remote_csv_gz_copy(merge_csv, load_table)
-            self.db.execute(bulk_insert_from_temp(self.db_history_table, load_table, cdc_lf.collect_schema().names()))
-            history_log.log_complete()
+            # postgres routes COPY'd rows to self.db_history_table partitions by header__timestamp
+            history_rows = self.db.copy_csv_files(
+                cdc_csvs, self.db_history_table, session=session, where=self.history_partitions.retention_where()
+            )
+            history_log.log_complete(history_rows=history_rows)
+
+            apply_log = ProcessLogger(
+                "cdc_apply",
+                table=self.db_fact_table,
+                load_folder=load_folder,
+                engine=CDC_APPLY_ENGINE,
+            )
+            if CDC_APPLY_ENGINE == "merge":
+                self.cdc_merge(cdc_lf, op_and_key, session)
+            else:
+                self.cdc_apply_phased(cdc_lf, op_and_key, load_folder, session)
+            apply_log.log_complete()
+
+    def cdc_load_folder(self, load_folder: str, load_files: Optional[List[str]] = None) -> None:
+        """
+        load cdc.csv.gz files from load_folder into RDS
+
+        1. Verify SCHEMA of cdc files matches RDS tables, CREATE missing self.db_history_table partitions
+        2. Load cdc files into self.db_history_table table
+        3. Load INSERT records from cdc files into self.db_fact_table
+        4. Load UPDATE records from cdc files into self.db_fact_table
+        5. Perform DELETE operataions from cdc files on self.db_fact_table
+           (steps 2-5 are applied in one transaction, see cdc_apply_folder)
+        6. VACUUM / ANALYZE fact table and touched history partitions, if needed
+        7. Delete loaded files
+
+        steps 3-5 are run as a single MERGE statement if CDC_APPLY_ENGINE is "merge"
 
-            insert_phase_log = ProcessLogger("cdc_insert_phase", table=self.db_fact_table, load_folder=load_folder)
-            self.cdc_insert(cdc_lf, load_table)
-            insert_phase_log.log_complete()
+        cdc files are scanned and COPY'd directly as a file list, unless CDC_MERGE_FILES is set,
+        then they are first merged into one MERGED_FNAME csv file
 
-            update_phase_log = ProcessLogger("cdc_update_phase", table=self.db_fact_table, load_folder=load_folder)
-            self.cdc_update(cdc_lf, load_table, key_columns)
-            update_phase_log.log_complete()
+        filtered cdc dataframe is materialized once (see cache_cdc_lf) and shared by all phases
 
-            delete_phase_log = ProcessLogger("cdc_delete_phase", table=self.db_fact_table, load_folder=load_folder)
-            self.cdc_delete(cdc_lf, load_table, key_columns)
-            delete_phase_log.log_complete()
+        a failure is logged and re-raised, so no later load folder moves last_cdc_ts past this load folder
+        and it is retried by the next run
+
+        :param load_folder: folder containing csv.gz files to be loaded
+        :param load_files: paths of files in load_folder to load, all folder files if not provided
+        """
+        if load_files is None:
+            load_files = [os.path.join(load_folder, f) for f in os.listdir(load_folder)]
+        logger = ProcessLogger(
+            "cdc_load_folder",
+            load_folder=load_folder,
+            table=self.db_fact_table,
+            file_count=len(load_files),
+        )
+        try:
+            dfm_object = os.path.basename(load_files[0]).replace(".csv", ".dfm").replace("|", "/")
+
+            cdc_ts = max(re_get_first(load_file, RE_CDC_TS) for load_file in load_files)
+            cdc_csvs = load_files
+            if CDC_MERGE_FILES:
+                merge_cdc_csv_gz_files(load_folder, load_files)
+                cdc_csvs = [os.path.join(load_folder, MERGED_FNAME)]
+
+            self.cdc_verify_schema(dfm_object)
+            cdc_lf = cache_cdc_lf(lf_from_merged_csv(cdc_csvs, dfm_object), load_files, load_folder)
+
+            # key column NULL stats of whole load folder decide `=` or `IS NOT DISTINCT FROM` for all phases
+            key_columns = [col["name"].lower() for col in self.etl_status.last_schema if col["primaryKeyPos"] > 0]
+            op_and_key = key_column_join_type(cdc_lf, key_columns)
+
+            date_range = cdc_date_range(cdc_lf)
+            if date_range is not None:
+                self.history_partitions.ensure_range(*date_range)
+
+            self.cdc_apply_folder(cdc_lf, cdc_csvs, op_and_key, load_folder)
+
+            self.cdc_table_maintenance(date_range)
 
             self.update_status(last_cdc_ts=max(cdc_ts, self.etl_status.last_cdc_ts))
             self.save_status(self.etl_status)
@@ -456,55 +823,74 @@ class CubicODSQlik:
 
         except Exception as exception:
             logger.log_failure(exception)
+            raise
         finally:
-            shutil.rmtree(load_folder, ignore_errors=True)
-            self.db.vaccuum_analyze(self.db_history_table)
-            self.db.vaccuum_analyze(self.db_fact_table)
-
-    def cdc_check_load_folders(self, tmp_dir: str, max_folder_bytes: int = 0) -> None:
-        """
-        Check all cdc hash folders in tmp_dir
-        if
-            size of hash folder is larger than max_folder_bytes
-            or more than 5000 files in folder
-        then load folder files into RDS
-
-        :param tmp_dir: folder containing cdc hash folder partitions
-        :param max_folder_bytes: folder size threshold to trigger load operation
-        """
-        for folder in os.listdir(tmp_dir):
-            load_folder = os.path.join(tmp_dir, folder)
-            if not os.path.isdir(load_folder):
-                continue
-            file_list = os.listdir(load_folder)
-            folder_count = len(file_list)
-            folder_bytes = sum(os.path.getsize(os.path.join(load_folder, f)) for f in file_list)
-            if folder_bytes > max_folder_bytes or folder_count > 5_000:
-                self.cdc_load_folder(load_folder)
+            for load_file in load_files + [os.path.join(load_folder, f) for f in (MERGED_FNAME, CDC_CACHE_FNAME)]:
+                if os.path.exists(load_file):
+                    os.remove(load_file)
 
     def process_cdc_files(self) -> None:
         """
-        1. download cdc files in batches
+        1. download cdc files in background threads
         2. extract header row from each cdc file, convert it to a sha1 hash to be used as a folder name
-        3. move cdc file to hash folder for later merging
-        4. when hash folder size reaches threshold limit, load folder into RDS
+        3. save cdc file to hash folder for later merging
+        4. when hash folder size reaches threshold limit, queue folder to be loaded into RDS by background
+           loader thread, while downloads continue
+
+        local disk usage of downloaded cdc files is kept under CDC_DISK_BUDGET_BYTES, downloads in flight
+        count against it with CDC_DOWNLOAD_SIZE_RATIO times their compressed bytes
+
+        downloads in flight are limited by their compressed bytes, from the S3 listing, to
+        CDC_DOWNLOAD_INFLIGHT_BYTES, so many small files are downloaded at once and few large ones
         """
-        pool = ThreadPoolExecutor(max_workers=threading_cpu_count())
+        max_workers = threading_cpu_count()
 
         with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp_dir:
-            work_files = [(wf, tmp_dir) for wf in get_cdc_gz_csvs(self.etl_status, self.table)]
-            for batch in batched(work_files, 4):
-                # Download batch of cdc csv.gz files
-                for _ in pool.map(thread_save_csv_file, batch):
-                    pass
+            loader = CDCFolderLoader(self.cdc_load_folder)
+            downloads: Deque[Tuple[Future[Optional[Tuple[str, int]]], int]] = deque()
+            inflight_bytes = 0
 
-                # load any cdc hash folder greater than max_folder_bytes
-                self.cdc_check_load_folders(tmp_dir, max_folder_bytes=256 * 1024 * 1024)
+            def commit_download() -> int:
+                """commit oldest download to loader, return its compressed bytes"""
+                future, object_bytes = downloads.popleft()
+                loader.add_cdc_file(future.result())
+                return object_bytes
 
-            # load all remaining cdc hash folders
-            self.cdc_check_load_folders(tmp_dir)
-
-        pool.shutdown()
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    for cdc_object in get_cdc_gz_csvs(self.etl_status, self.table):
+                        # throttle downloads on compressed bytes, number and estimated csv bytes in flight
+                        reserve_bytes = cdc_object.size * CDC_DOWNLOAD_SIZE_RATIO
+                        while downloads and (
+                            len(downloads) >= 4 * max_workers
+                            or inflight_bytes + cdc_object.size > CDC_DOWNLOAD_INFLIGHT_BYTES
+                            or loader.disk_bytes + inflight_bytes * CDC_DOWNLOAD_SIZE_RATIO + reserve_bytes
+                            > CDC_DISK_BUDGET_BYTES
+                        ):
+                            inflight_bytes -= commit_download()
+
+                        # throttle downloads on bytes of cdc files on disk, plus reserve of next download
+                        loader.wait_for_disk(CDC_DISK_BUDGET_BYTES, reserve_bytes)
+
+                        downloads.append(
+                            (pool.submit(thread_save_csv_file, (cdc_object.path, tmp_dir)), cdc_object.size)
+                        )
+                        inflight_bytes += cdc_object.size
+
+                        # downloads are committed in submission order to keep cdc files ordered by timestamp
+                        while downloads and downloads[0][0].done():
+                            inflight_bytes -= commit_download()
+
+                        # queue any cdc hash folder greater than max_folder_bytes
+                        loader.check_folders(max_folder_bytes=256 * 1024 * 1024)
+
+                    while downloads:
+                        commit_download()
+
+                # load all remaining cdc hash folders
+                loader.check_folders()
+            finally:
+                loader.finish()
 
     def snapshot_reset(self) -> None:
         """
@@ -514,6 +900,7 @@ class CubicODSQlik:
         """
 
         s3_delete_object(self.status_path)
+        s3_delete_object(cdc_listing_manifest_path(self.table))
         self.etl_status = self.load_etl_status()
 
         self.db.execute(drop_table(self.db_history_table))
@@ -546,22 +933,35 @@ class CubicODSQlik:
                 self.snapshot_reset()
                 new_snapshot_logger.log_complete()
 
-            # create tables and history table partitions
-            # will be no-op if tables already exist
-            self.db.execute(create_tables_from_schema(self.etl_status.last_schema, self.db_fact_table))
-            self.db.execute(create_history_table_partitions(self.db_history_table, self.etl_status.current_snapshot_ts))
+            # create tables, will be no-op if tables already exist
+            # history table partitions are created for header__timestamp range of each load
+            # indexes are built after snapshot load, so bulk loaded rows do not pay for index maintenance
+            snapshot_load = self.etl_status.last_cdc_ts == ""
+            self.db.execute(
+                create_tables_from_schema(
+                    self.etl_status.last_schema,
+                    self.db_fact_table,
+                    with_indexes=not snapshot_load,
+                )
+            )
+            # pylint: disable-next=attribute-defined-outside-init
+            self.history_partitions = HistoryPartitionManager(self.db, self.db_history_table)
+            if HISTORY_DEFAULT_PARTITION:
+                self.history_partitions.ensure_default()
 
-            if self.etl_status.last_cdc_ts == "":
+            if snapshot_load:
                 self.rds_snapshot_load()
 
             self.process_cdc_files()
 
             self.db.execute(drop_table(f"{self.db_fact_table}_load"))
+            self.history_partitions.apply_retention()
 
             self.save_status(self.etl_status)
-            logger.log_complete()
+            logger.log_complete(peak_rss_mb=peak_rss_mb())
 
         except Exception as exception:
+            logger.add_metadata(peak_rss_mb=peak_rss_mb(), print_log=False)
             logger.log_failure(exception)
 
 
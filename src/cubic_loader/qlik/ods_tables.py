@@ -151,3 +151,12 @@ CUBIC_ODS_TABLES = [
     "EDW.CCH_RULE_MULTIPLIER_TYPE",
     "EDW.CCH_RULES_SET",
 ]
+
+# Relative load weight of CUBIC_ODS_TABLES, used by the parallel table scheduler
+# tables not listed here have a weight of 1
+CUBIC_ODS_TABLE_WEIGHTS = {
+    "EDW.USE_TRANSACTION": 4,
+    "EDW.SALE_TRANSACTION": 2,
+    "EDW.DEVICE_EVENT": 2,
+    "EDW.ABP_TAP": 2,
+}
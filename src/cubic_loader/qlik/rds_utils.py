@@ -2,10 +2,10 @@ from typing import List
 from typing import Optional
 from typing import Tuple
 from datetime import date
-from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
 from cubic_loader.qlik.utils import DFMSchemaFields
+from cubic_loader.qlik.utils import RE_HISTORY_PARTITION
 
 
 def qlik_type_to_pg(qlik_type: str, scale: int, precision: int) -> str:
@@ -51,7 +51,93 @@ def qlik_type_to_pg(qlik_type: str, scale: int, precision: int) -> str:
     return return_type
 
 
-def create_tables_from_schema(schema: List[DFMSchemaFields], schema_and_table: str) -> str:
+def dfm_key_columns(schema: List[DFMSchemaFields]) -> List[str]:
+    """
+    primary key column names of DFM schema
+
+    :param schema: Schema List from DFM file
+
+    :return: primary key column names
+    """
+    dfm_keys = [column["name"] for column in schema if column["primaryKeyPos"] > 0]
+    assert len(dfm_keys) > 0
+
+    return dfm_keys
+
+
+def create_index_statements(schema: List[DFMSchemaFields], schema_and_table: str) -> List[str]:
+    """
+    produce CREATE INDEX strings for FACT and HISTORY tables
+
+    :param schema: Schema List from DFM file
+    :schema_and_table: Schema and Table as 'schema.table'
+
+    :return: [FACT table index statement, HISTORY table index statement]
+    """
+    dfm_keys = dfm_key_columns(schema)
+
+    # FACT Table Index on Primary Key columns
+    fact_index = (
+        f"CREATE INDEX IF NOT EXISTS {schema_and_table.replace('.','_')}_fact_pk_idx on {schema_and_table} "
+        f"({','.join(dfm_keys)});"
+    )
+
+    # INDEX on HISTORY Table that will be used for creating FACT table
+    index_columns = dfm_keys + ["header__change_oper", "header__change_seq DESC"]
+    history_index = (
+        f"CREATE INDEX IF NOT EXISTS {schema_and_table.replace('.','_')}_to_fact_idx on {schema_and_table}_history "
+        f"({','.join(index_columns)});"
+    )
+
+    return [fact_index, history_index]
+
+
+def drop_fact_index(schema_and_table: str) -> str:
+    """
+    produce DROP INDEX string for FACT table index created by create_index_statements
+
+    :schema_and_table: Schema and Table as 'schema.table'
+
+    :return: DROP INDEX command
+    """
+    schema = schema_and_table.split(".")[0]
+    return f"DROP INDEX IF EXISTS {schema}.{schema_and_table.replace('.','_')}_fact_pk_idx;"
+
+
+def history_partition_index_statements(
+    schema: List[DFMSchemaFields], schema_and_table: str, partitions: List[str]
+) -> Tuple[str, List[str]]:
+    """
+    produce CREATE INDEX strings to build HISTORY table index one partition at a time
+
+    parent index is created ON ONLY the HISTORY table (invalid until every partition index is attached),
+    each partition index is created and then ATTACHED to parent index
+
+    :param schema: Schema List from DFM file
+    :param schema_and_table: Schema and Table as 'schema.table'
+    :param partitions: HISTORY table partitions as 'schema.table'
+
+    :return: Tuple[parent index statement, [partition index statement, ...]]
+    """
+    index_columns = ",".join(dfm_key_columns(schema) + ["header__change_oper", "header__change_seq DESC"])
+    db_schema = schema_and_table.split(".")[0]
+    parent_index = f"{schema_and_table.replace('.','_')}_to_fact_idx"
+
+    parent_statement = (
+        f"CREATE INDEX IF NOT EXISTS {parent_index} on ONLY {schema_and_table}_history ({index_columns});"
+    )
+    partition_statements: List[str] = []
+    for partition in partitions:
+        partition_index = f"{partition.split('.')[-1]}_to_fact_idx"
+        partition_statements.append(
+            f"CREATE INDEX IF NOT EXISTS {partition_index} on {partition} ({index_columns}); "
+            f"ALTER INDEX {db_schema}.{parent_index} ATTACH PARTITION {db_schema}.{partition_index};"
+        )
+
+    return (parent_statement, partition_statements)
+
+
+def create_tables_from_schema(schema: List[DFMSchemaFields], schema_and_table: str, with_indexes: bool = True) -> str:
     """
     produce CREATE table string for FACT and HISTORY tables from dfm snapshot path
 
@@ -59,18 +145,14 @@ def create_tables_from_schema(schema: List[DFMSchemaFields], schema_and_table: s
 
     :param schema: Schema List from DFM file
     :schema_and_table: Schema and Table as 'schema.table'
+    :param with_indexes: also CREATE FACT and HISTORY table indexes (see create_index_statements)
 
     :return: SQL Statements to CREATE FACT and HISTORY tables and any associated indexes
     """
     ops: List[str] = []
     dfm_columns: List[str] = []
-    dfm_keys: List[str] = []
     for column in schema:
         dfm_columns.append(f"{column['name']} {qlik_type_to_pg(column['type'], column['scale'], column['precision'])}")
-        if column["primaryKeyPos"] > 0:
-            dfm_keys.append(column["name"])
-
-    assert len(dfm_keys) > 0
 
     # Create FACT Table
     # FACT table is created without a primary key
@@ -78,12 +160,6 @@ def create_tables_from_schema(schema: List[DFMSchemaFields], schema_and_table: s
     # Postgres does not allow NULL in Primary Key columns, instead a standard INDEX on the Key columns is created
     ops.append(f"CREATE TABLE IF NOT EXISTS {schema_and_table} ({",".join(dfm_columns)});")
 
-    # FACT Table Index on Primary Key columns
-    ops.append(
-        f"CREATE INDEX IF NOT EXISTS {schema_and_table.replace('.','_')}_fact_pk_idx on {schema_and_table} "
-        f"({','.join(dfm_keys)});"
-    )
-
     # Create HISTORY Table
     # partitioned by header__timestamp
     header_fields = (
@@ -104,47 +180,178 @@ def create_tables_from_schema(schema: List[DFMSchemaFields], schema_and_table: s
     load_columns = header_cols + dfm_columns
     ops.append(f"CREATE TABLE IF NOT EXISTS {schema_and_table}_load ({",".join(load_columns)});")
 
-    # Create INDEX on HISTORY Table that will be used for creating FACT table
-    index_columns = dfm_keys + ["header__change_oper", "header__change_seq DESC"]
-    ops.append(
-        f"CREATE INDEX IF NOT EXISTS {schema_and_table.replace('.','_')}_to_fact_idx on {schema_and_table}_history "
-        f"({','.join(index_columns)});"
-    )
+    # Create FACT and HISTORY table indexes
+    if with_indexes:
+        ops.extend(create_index_statements(schema, schema_and_table))
 
     return " ".join(ops)
 
 
-def create_history_table_partitions(schema_and_table: str, start_ts: Optional[str] = None) -> str:
+def select_partitions(schema_and_table: str) -> str:
     """
-    produce CREATE partition table strings for history table
+    produce SELECT query for partitions of a partitioned table, from pg_inherits
+
+    :param schema_and_table: name and schema of partitioned table as 'schema.table'
+
+    :return: SELECT query with "partition" column as 'schema.table'
+    """
+    return (
+        "SELECT n.nspname || '.' || c.relname AS partition "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_namespace n ON n.oid = c.relnamespace "
+        f"WHERE i.inhparent = '{schema_and_table}'::regclass ORDER BY c.relname;"
+    )
 
-    if `start_ts` IS NOT provided, produce CREATE statements for next 3 months from today
-    if `start_ts` IS provided, produce CREATE statements for month of `start_ts` to 3 months from today
+
+def history_partition_name(schema_and_table: str, part_date: date) -> str:
+    """
+    name of monthly HISTORY table partition containing part_date
 
     :param schema_and_table: name and schema of HISTORY table as 'schema.table'
-    :param start_ts: date timestamp as string starting with YYYYMMDD
+    :param part_date: any date in partition month
 
-    :return: all partition CREATE statments as single string
+    :return: partition table as 'schema.table'
     """
-    part_date = date.today()
-    if start_ts is not None:
-        ts_dt = datetime.strptime(start_ts[:8], "%Y%m%d")
-        part_date = ts_dt.date()
+    return f"{schema_and_table}_y{part_date.year}m{part_date.month}"
 
-    part_date = part_date.replace(day=1)
-    part_end = date.today().replace(day=1) + relativedelta(months=3)
-
-    part_tables: List[str] = []
-    while part_date < part_end:
-        part_table = f"{schema_and_table}_y{part_date.year}m{part_date.month}"
-        create_part = (
-            f"CREATE TABLE IF NOT EXISTS {part_table} PARTITION OF {schema_and_table} "
-            f"FOR VALUES FROM ('{part_date}') TO ('{part_date + relativedelta(months=1)}');"
-        )
-        part_tables.append(create_part)
+
+def history_partitions_for_range(schema_and_table: str, min_date: date, max_date: date) -> List[str]:
+    """
+    names of monthly HISTORY table partitions covering min_date to max_date
+
+    :param schema_and_table: name and schema of HISTORY table as 'schema.table'
+    :param min_date: first date of range
+    :param max_date: last date of range
+
+    :return: partition tables as 'schema.table'
+    """
+    part_date = min_date.replace(day=1)
+    partitions: List[str] = []
+    while part_date <= max_date:
+        partitions.append(history_partition_name(schema_and_table, part_date))
         part_date += relativedelta(months=1)
 
-    return " ".join(part_tables)
+    return partitions
+
+
+def history_partition_month(partition: str) -> Optional[date]:
+    """
+    first day of month covered by monthly HISTORY table partition
+
+    :param partition: partition table named by history_partition_name
+
+    :return: first day of partition month, or None if partition is not a monthly partition
+    """
+    match = RE_HISTORY_PARTITION.search(partition)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def create_history_partition(schema_and_table: str, part_date: date) -> str:
+    """
+    produce CREATE partition table string for month of part_date
+
+    :param schema_and_table: name and schema of HISTORY table as 'schema.table'
+    :param part_date: any date in partition month
+
+    :return: CREATE TABLE command
+    """
+    part_date = part_date.replace(day=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {history_partition_name(schema_and_table, part_date)} "
+        f"PARTITION OF {schema_and_table} "
+        f"FOR VALUES FROM ('{part_date}') TO ('{part_date + relativedelta(months=1)}');"
+    )
+
+
+def create_history_partition_from_default(schema_and_table: str, part_date: date, default_partition: str) -> str:
+    """
+    produce statements to create partition for month of part_date, on a HISTORY table with a DEFAULT partition
+
+    rows of partition month already routed to default_partition are moved to the new partition before it is
+    ATTACH'd, postgres refuses to create the partition while default_partition holds any of them
+
+    :param schema_and_table: name and schema of HISTORY table as 'schema.table'
+    :param part_date: any date in partition month
+    :param default_partition: DEFAULT partition of HISTORY table as 'schema.table'
+
+    :return: CREATE, move and ATTACH commands as single string, to be run in one transaction
+    """
+    part_date = part_date.replace(day=1)
+    part_end = part_date + relativedelta(months=1)
+    part_table = history_partition_name(schema_and_table, part_date)
+    return (
+        f"CREATE TABLE {part_table} (LIKE {schema_and_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS); "
+        f"WITH moved AS (DELETE FROM {default_partition} "
+        f"WHERE header__timestamp >= '{part_date}' AND header__timestamp < '{part_end}' RETURNING *) "
+        f"INSERT INTO {part_table} SELECT * FROM moved; "
+        f"ALTER TABLE {schema_and_table} ATTACH PARTITION {part_table} "
+        f"FOR VALUES FROM ('{part_date}') TO ('{part_end}');"
+    )
+
+
+def create_history_default_partition(schema_and_table: str) -> str:
+    """
+    produce CREATE string for DEFAULT partition of HISTORY table
+
+    :param schema_and_table: name and schema of HISTORY table as 'schema.table'
+
+    :return: CREATE TABLE command
+    """
+    return f"CREATE TABLE IF NOT EXISTS {schema_and_table}_default " f"PARTITION OF {schema_and_table} DEFAULT;"
+
+
+def detach_history_partition(schema_and_table: str, partition: str) -> str:
+    """
+    produce ALTER table strings to DETACH partition from HISTORY table
+
+    detached partition is kept as a stand-alone table, renamed with a `_detached` suffix, so its
+    partition name is free to be created again
+
+    :param schema_and_table: name and schema of HISTORY table as 'schema.table'
+    :param partition: partition table as 'schema.table'
+
+    :return: ALTER TABLE commands as single string
+    """
+    return (
+        f"ALTER TABLE {schema_and_table} DETACH PARTITION {partition}; "
+        f"ALTER TABLE {partition} RENAME TO {partition.split('.')[-1]}_detached;"
+    )
+
+
+def set_snapshot_header_defaults(load_table: str, snapshot_ts: str) -> str:
+    """
+    produce ALTER table string to set header__ column defaults of load table to snapshot values
+
+    rows COPY'd without header__ columns are stamped as snapshot load records on the way in
+
+    :param load_table: name and schema of load table as 'schema.table'
+    :param snapshot_ts: snapshot timestamp as YYYYMMDDTHHMMSSZ
+
+    :return: ALTER TABLE command
+    """
+    return (
+        f"ALTER TABLE {load_table} "
+        f"ALTER COLUMN header__timestamp SET DEFAULT to_timestamp('{snapshot_ts}','YYYYMMDDTHHMISSZ'), "
+        "ALTER COLUMN header__change_oper SET DEFAULT 'L', "
+        f"ALTER COLUMN header__change_seq SET DEFAULT rpad(regexp_replace('{snapshot_ts}','\\D','','g'),35,'0')::numeric;"
+    )
+
+
+def drop_snapshot_header_defaults(load_table: str) -> str:
+    """
+    produce ALTER table string to remove header__ column defaults of load table
+
+    :param load_table: name and schema of load table as 'schema.table'
+
+    :return: ALTER TABLE command
+    """
+    return (
+        f"ALTER TABLE {load_table} "
+        "ALTER COLUMN header__timestamp DROP DEFAULT, "
+        "ALTER COLUMN header__change_oper DROP DEFAULT, "
+        "ALTER COLUMN header__change_seq DROP DEFAULT;"
+    )
 
 
 def drop_table(schema_and_table: str) -> str:
@@ -204,22 +411,36 @@ def convert_cols_to_string(new_columns: list[str], schema_and_table: str) -> str
     return " ".join(alter_strings)
 
 
-def bulk_delete_from_temp(schema_and_table: str, op_and_keys: List[Tuple[str, str]]) -> str:
+def create_staging_table(load_table: str, staging_table: str) -> str:
+    """
+    produce CREATE statement for session TEMP staging table with the columns of load_table
+
+    TEMP staging tables are DROPPED at the end of the creating transaction
+
+    :param load_table: name and schema of table to copy columns from as 'schema.table'
+    :param staging_table: name of staging table, as 'pg_temp.table'
+
+    :return: DROP and CREATE TABLE commands
+    """
+    return f"{drop_table(staging_table)} CREATE TEMP TABLE {staging_table} (LIKE {load_table}) ON COMMIT DROP;"
+
+
+def bulk_delete_from_temp(schema_and_table: str, tmp_table: str, op_and_keys: List[Tuple[str, str]]) -> str:
     """
     create query to DELETE records from table based on key columns
     """
-    tmp_table = f"{schema_and_table}_load"
     where_clause = " AND ".join([f"{schema_and_table}.{t} {op} {tmp_table}.{t}" for op, t in op_and_keys])
     delete_query = f"DELETE FROM {schema_and_table} USING {tmp_table} WHERE {where_clause};"
 
     return delete_query
 
 
-def bulk_update_from_temp(schema_and_table: str, update_column: str, op_and_keys: List[Tuple[str, str]]) -> str:
+def bulk_update_from_temp(
+    schema_and_table: str, tmp_table: str, update_column: str, op_and_keys: List[Tuple[str, str]]
+) -> str:
     """
     create query to UPDATE records from table based on key columns
     """
-    tmp_table = f"{schema_and_table}_load"
     where_clause = " AND ".join([f"{schema_and_table}.{t} {op} {tmp_table}.{t}" for op, t in op_and_keys])
     update_query = (
         f"UPDATE {schema_and_table} SET {update_column}={tmp_table}.{update_column} "
@@ -229,6 +450,60 @@ def bulk_update_from_temp(schema_and_table: str, update_column: str, op_and_keys
     return update_query
 
 
+def bulk_update_columns_from_temp(
+    schema_and_table: str, tmp_table: str, update_columns: List[str], op_and_keys: List[Tuple[str, str]]
+) -> str:
+    """
+    create query to UPDATE multiple columns of records from table based on key columns
+
+    NULL values in temp table leave the existing column value unchanged
+    """
+    where_clause = " AND ".join([f"{schema_and_table}.{t} {op} {tmp_table}.{t}" for op, t in op_and_keys])
+    set_clause = ",".join([f"{c}=COALESCE({tmp_table}.{c},{schema_and_table}.{c})" for c in update_columns])
+    update_query = f"UPDATE {schema_and_table} SET {set_clause} FROM {tmp_table} WHERE {where_clause};"
+
+    return update_query
+
+
+def merge_from_temp(
+    schema_and_table: str, tmp_table: str, columns: List[str], op_and_keys: List[Tuple[str, str]]
+) -> str:
+    """
+    create MERGE query to apply final state cdc records from temp table to table in one statement
+
+    temp table holds one record per key with final header__change_oper of:
+        "D": DELETE matching records
+        "I": UPDATE matching records with all values, or INSERT record if no match
+        "U": UPDATE matching records with non-NULL values
+
+    :param schema_and_table: name and schema of table as 'schema.table'
+    :param tmp_table: name and schema of temp table as 'schema.table'
+    :param columns: key and non-key columns of temp table records (without header__ columns)
+    :param op_and_keys: join operator and key column pairs
+
+    :return: MERGE query
+    """
+    key_columns = [t for _, t in op_and_keys]
+    update_columns = [c for c in columns if c not in key_columns]
+    on_clause = " AND ".join([f"f.{t} {op} s.{t}" for op, t in op_and_keys])
+
+    merge_ops = [
+        f"MERGE INTO {schema_and_table} AS f USING {tmp_table} AS s ON {on_clause}",
+        "WHEN MATCHED AND s.header__change_oper = 'D' THEN DELETE",
+    ]
+    if update_columns:
+        insert_set = ",".join([f"{c}=s.{c}" for c in update_columns])
+        update_set = ",".join([f"{c}=COALESCE(s.{c},f.{c})" for c in update_columns])
+        merge_ops.append(f"WHEN MATCHED AND s.header__change_oper = 'I' THEN UPDATE SET {insert_set}")
+        merge_ops.append(f"WHEN MATCHED THEN UPDATE SET {update_set}")
+    merge_ops.append(
+        f"WHEN NOT MATCHED AND s.header__change_oper = 'I' THEN INSERT ({','.join(columns)}) "
+        f"VALUES ({','.join([f's.{c}' for c in columns])})"
+    )
+
+    return f"{' '.join(merge_ops)};"
+
+
 def bulk_insert_from_temp(insert_table_and_schema: str, temp_table_and_schema: str, columns: List[str]) -> str:
     """
     create query to INSERT records from temp table to fact table
@@ -1,17 +1,34 @@
 import os
 import re
 import json
+from functools import lru_cache
 from typing import NamedTuple
 from typing import TypedDict
 from typing import List
+from typing import Optional
+from typing import Union
 from typing import Tuple
+from tempfile import NamedTemporaryFile
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
 
 import polars as pl
 
 from cubic_loader.utils.aws import running_in_aws
 from cubic_loader.utils.aws import s3_get_object
-from cubic_loader.utils.aws import s3_get_client
+from cubic_loader.utils.aws import s3_list_key_range
+from cubic_loader.utils.aws import s3_list_sharded
+from cubic_loader.utils.aws import S3Object
+from cubic_loader.utils.aws import s3_object_exists
+from cubic_loader.utils.aws import s3_upload_file
+from cubic_loader.utils.remote_locations import ODS_STATUS
+from cubic_loader.utils.remote_locations import ODIN_PROCESSED
+from cubic_loader.utils.remote_locations import QLIK
+from cubic_loader.utils.remote_locations import S3_ARCHIVE
 from cubic_loader.utils.logger import ProcessLogger
+from cubic_loader.utils.runtime import env_bool
+from cubic_loader.utils.runtime import env_int
 
 
 class DFMDetails(NamedTuple):
@@ -33,6 +50,22 @@ class DFMSchemaFields(TypedDict):
     primaryKeyPos: int
 
 
+class CDCListing(NamedTuple):
+    """Result of CDC csv.gz object listing"""
+
+    objects: List[S3Object]
+    # last listed key, such that no key at or before it has a cdc timestamp newer than listing min_ts
+    safe_start_after: str
+
+
+class CDCListingManifest(NamedTuple):
+    """Fields to resume CDC object listing of a Snapshot from a StartAfter key"""
+
+    snapshot_ts: str
+    min_ts: str
+    start_after: str
+
+
 class TableStatus(NamedTuple):
     """Fields to track progress of S3 to RDS ETL Operations"""
 
@@ -46,6 +79,8 @@ RE_SNAPSHOT_TS = re.compile(r"(\d{8}T\d{6}Z)")
 
 RE_CDC_TS = re.compile(r"(\d{8}-\d{9})")
 
+RE_HISTORY_PARTITION = re.compile(r"_y(\d{4})m(\d{1,2})$")
+
 DFM_COLUMN_SCHEMA = pl.Schema(
     {
         "name": pl.String(),
@@ -65,6 +100,77 @@ CDC_COLUMNS = (
 
 MERGED_FNAME = "cdc_merged.csv"
 
+# number of .dfm schemas (and derived polars schemas) kept in memory
+DFM_CACHE_SIZE = 128
+
+CDC_CACHE_FNAME = "cdc_cache.arrow"
+
+# apply CDC UPDATE records with one UPDATE statement per column (legacy path, kept for comparing results)
+CDC_UPDATE_PER_COLUMN = env_bool("QLIK_CDC_UPDATE_PER_COLUMN", False)
+
+# number of db connections used to UPDATE CDC key ranges in parallel, 0 or 1 to UPDATE in the load folder transaction
+# parallel UPDATES are committed before the load folder transaction, a failed load folder leaves them applied
+# without their history records until the load folder is retried by the next run
+CDC_UPDATE_WORKERS = env_int("QLIK_CDC_UPDATE_WORKERS", 0)
+
+# read size used when stream-decompressing downloaded cdc files to disk
+CDC_DOWNLOAD_BUFFER_BYTES = env_int("QLIK_CDC_DOWNLOAD_BUFFER_BYTES", 1024 * 1024)
+
+# engine used to apply cdc records of a load folder to fact table
+# "phased": separate INSERT, UPDATE and DELETE statements, "merge": single MERGE statement (Postgres 15+)
+CDC_APPLY_ENGINE = os.getenv("QLIK_CDC_APPLY_ENGINE", "phased").lower()
+
+# merge cdc files of a load folder into MERGED_FNAME before loading, instead of reading file list directly
+CDC_MERGE_FILES = env_bool("QLIK_CDC_MERGE_FILES", False)
+
+# cache of filtered cdc frame shared by insert/update/delete phases of a load folder
+# "memory": collect into memory, "ipc": write local Arrow IPC file, "none": re-scan cdc csv files for every phase
+CDC_FRAME_CACHE = os.getenv("QLIK_CDC_FRAME_CACHE", "memory").lower()
+
+# load folders with more csv bytes than this are not cached and fall back to lazy scanning of cdc csv files
+CDC_FRAME_CACHE_MAX_BYTES = env_int("QLIK_CDC_FRAME_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+
+# VACUUM (ANALYZE) tables after cdc load only if dead tuples are more than this percent of live tuples
+VACUUM_DEAD_TUPLE_PCT = env_int("QLIK_VACUUM_DEAD_TUPLE_PCT", 10)
+
+# ANALYZE tables after cdc load only if rows modified since last analyze are more than this percent of live tuples
+ANALYZE_MODIFIED_PCT = env_int("QLIK_ANALYZE_MODIFIED_PCT", 10)
+
+# days of cdc timestamps per concurrently listed key range of a CDC listing, 0 to list with one paginator
+CDC_LIST_SHARD_DAYS = env_int("QLIK_CDC_LIST_SHARD_DAYS", 0)
+
+# compressed bytes (from S3 listing) of cdc files being downloaded at one time, at least one file is always downloaded
+CDC_DOWNLOAD_INFLIGHT_BYTES = env_int("QLIK_CDC_DOWNLOAD_INFLIGHT_BYTES", 256 * 1024 * 1024)
+
+# estimated csv bytes per compressed byte of a cdc file, reserved against CDC_DISK_BUDGET_BYTES while downloading
+CDC_DOWNLOAD_SIZE_RATIO = env_int("QLIK_CDC_DOWNLOAD_SIZE_RATIO", 10)
+
+# number of db connections used to COPY snapshot csv.gz parts concurrently
+SNAPSHOT_COPY_WORKERS = env_int("QLIK_SNAPSHOT_COPY_WORKERS", 4)
+
+# number of db connections used to build FACT and HISTORY table indexes after snapshot load
+SNAPSHOT_INDEX_WORKERS = env_int("QLIK_SNAPSHOT_INDEX_WORKERS", 2)
+
+# build HISTORY table index after snapshot load one partition at a time, concurrently
+SNAPSHOT_INDEX_PER_PARTITION = env_bool("QLIK_SNAPSHOT_INDEX_PER_PARTITION", False)
+
+# maintenance_work_mem of sessions building indexes after snapshot load
+SNAPSHOT_INDEX_MAINTENANCE_WORK_MEM = os.getenv("QLIK_SNAPSHOT_INDEX_MAINTENANCE_WORK_MEM", "1GB")
+
+# bytes of downloaded cdc files allowed on local disk before downloads wait for loading to catch up
+CDC_DISK_BUDGET_BYTES = env_int("QLIK_CDC_DISK_BUDGET_BYTES", 2 * 1024 * 1024 * 1024)
+
+# add DEFAULT partition to HISTORY table, for rows outside of any monthly partition
+HISTORY_DEFAULT_PARTITION = env_bool("QLIK_HISTORY_DEFAULT_PARTITION", False)
+
+# monthly HISTORY table partitions older than this many months are removed after each run, and HISTORY rows
+# older than that are not loaded, 0 to keep all
+HISTORY_RETENTION_MONTHS = env_int("QLIK_HISTORY_RETENTION_MONTHS", 0)
+
+# removal of expired HISTORY table partitions
+# "drop": DETACH and DROP partition, "detach": DETACH partition and keep it as stand-alone `_detached` table for export
+HISTORY_RETENTION_ACTION = os.getenv("QLIK_HISTORY_RETENTION_ACTION", "drop").lower()
+
 
 def re_get_first(string: str, pattern: re.Pattern) -> str:
     """
@@ -84,57 +190,184 @@ def re_get_first(string: str, pattern: re.Pattern) -> str:
     return match.group(0)
 
 
+def cdc_list_shard_keys(prefix: str, from_ts: str, shard_days: int = CDC_LIST_SHARD_DAYS) -> List[str]:
+    """
+    produce keys splitting a CDC listing into date ranges of shard_days, from date of from_ts to today
+
+    cdc files are named by their YYYYMMDD- timestamp, so `prefix + YYYYMMDD` keys split the listing
+    into ranges of about equal size
+
+    :param prefix: prefix of cdc objects
+    :param from_ts: timestamp starting with YYYYMMDD of first range
+    :param shard_days: days per range, no shard keys if < 1
+
+    :return: shard keys in order
+    """
+    if shard_days < 1 or len(from_ts) < 8:
+        return []
+
+    shard_date = datetime.strptime(from_ts[:8], "%Y%m%d").date() + timedelta(days=shard_days)
+    shard_keys: List[str] = []
+    while shard_date <= date.today():
+        shard_keys.append(f"{prefix}{shard_date.strftime('%Y%m%d')}")
+        shard_date += timedelta(days=shard_days)
+
+    return shard_keys
+
+
 def s3_list_cdc_gz_objects(
     bucket: str,
     prefix: str,
     min_ts: str = "",
-) -> List[str]:
+    start_after: str = "",
+    shard_keys: Optional[List[str]] = None,
+) -> CDCListing:
     """
     provide list of s3 objects based on bucket and prefix
 
+    also finds the last key that a later listing, with a min_ts >= this min_ts, can safely resume from,
+    any keys at or before it are not cdc.csv.gz objects or have a cdc timestamp <= min_ts
+
     :param bucket: the name of the bucket with objects
     :param prefix: prefix for objs to return
     :param min_ts: filter for cdc.csv.gz objects
+    :param start_after: only list keys after this key (as S3 list_objects_v2 StartAfter)
+    :param shard_keys: list key ranges ending at these keys concurrently (see s3_list_sharded)
 
-    :return: List[s3://bucket/key, ...]
+    :return: CDCListing of [S3Object, ...] and safe StartAfter key
     """
     logger = ProcessLogger(
         "s3_list_cdc_gz_objects",
         bucket=bucket,
         prefix=prefix,
         min_ts=min_ts,
+        start_after=start_after,
+        shards=len(shard_keys or []) + 1,
     )
     try:
-        s3_client = s3_get_client()
-        paginator = s3_client.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
-
-        filepaths = []
-        for page in pages:
-            if page["KeyCount"] == 0:
-                continue
-            for obj in page["Contents"]:
-                if obj["Size"] == 0 or not str(obj["Key"]).lower().endswith(".csv.gz"):
-                    continue
+        if shard_keys:
+            objects = s3_list_sharded(bucket, prefix, shard_keys, start_after)
+        else:
+            objects = s3_list_key_range(bucket, prefix, start_after)
+
+        cdc_objects: List[S3Object] = []
+        safe_start_after = start_after
+        for obj in objects:
+            obj_ts = ""
+            if obj.size > 0 and obj.key.lower().endswith(".csv.gz"):
                 try:
-                    obj_ts = re_get_first(obj["Key"], RE_CDC_TS)
-                    if obj_ts > min_ts:
-                        filepaths.append(os.path.join("s3://", bucket, obj["Key"]))
+                    obj_ts = re_get_first(obj.key, RE_CDC_TS)
                 except Exception as _:
-                    continue
-
-        logger.log_complete(objects_found=len(filepaths))
-        return filepaths
+                    pass
+            if obj_ts > min_ts:
+                cdc_objects.append(obj)
+            elif len(cdc_objects) == 0:
+                safe_start_after = obj.key
+
+        logger.log_complete(
+            objects_listed=len(objects),
+            objects_found=len(cdc_objects),
+            objects_bytes=sum(obj.size for obj in cdc_objects),
+            safe_start_after=safe_start_after,
+        )
+        return CDCListing(objects=cdc_objects, safe_start_after=safe_start_after)
 
     except Exception as exception:
         logger.log_failure(exception)
-        return []
+        return CDCListing(objects=[], safe_start_after=start_after)
+
+
+def cdc_listing_manifest_path(table: str) -> str:
+    """S3 path of CDC listing manifest for CUBIC Table Name"""
+    return os.path.join(ODS_STATUS, f"{table}_cdc_listing.json")
+
+
+def load_cdc_listing_start_after(etl_status: TableStatus, table: str) -> str:
+    """
+    get StartAfter key for CDC listing of current Snapshot from listing manifest
+
+    manifest is only used if it was saved for the current Snapshot with a min_ts that is not
+    newer than etl_status.last_cdc_ts (after a snapshot_reset, listing starts over)
+
+    :param etl_status: status of ETL operation
+    :param table: CUBIC Table Name
+
+    :return: StartAfter key or "" to list from start of Snapshot
+    """
+    manifest_path = cdc_listing_manifest_path(table)
+    try:
+        if not s3_object_exists(manifest_path):
+            return ""
+        manifest = CDCListingManifest(**json.load(s3_get_object(manifest_path)))
+    except Exception as exception:
+        ProcessLogger("load_cdc_listing_manifest", manifest_path=manifest_path).log_failure(exception)
+        return ""
+
+    if manifest.snapshot_ts != etl_status.current_snapshot_ts or manifest.min_ts > etl_status.last_cdc_ts:
+        return ""
+
+    return manifest.start_after
+
+
+def save_cdc_listing_manifest(manifest: CDCListingManifest, table: str) -> None:
+    """write CDC listing manifest to S3"""
+    with NamedTemporaryFile(mode="w+") as f:
+        json.dump(manifest._asdict(), f)
+        f.flush()
+        s3_upload_file(f.name, cdc_listing_manifest_path(table))
+
+
+def get_cdc_gz_csvs(etl_status: TableStatus, table: str) -> List[S3Object]:
+    """
+    find all available CDC csv.gz files for a Snapshot from Archive and Error buckets
+
+    listing resumes from the StartAfter key saved in the CDC listing manifest by the previous run,
+    so keys that were already processed are not listed again
+
+    :param etl_status: status of ETL operation
+    :param table: CUBIC Table Name
+
+    :return: List of S3Object records sorted by cdc timestamp (Ascending)
+    """
+    table_prefix = os.path.join(ODIN_PROCESSED, QLIK, f"{table}__ct/")
+    snapshot_prefix = f"{table_prefix}snapshot={etl_status.current_snapshot_ts}/"
+
+    # last_cdc_ts is "" or "0" (after snapshot load) until first cdc load folder is loaded
+    shard_from_ts = etl_status.last_cdc_ts
+    if RE_CDC_TS.match(shard_from_ts) is None:
+        shard_from_ts = etl_status.current_snapshot_ts
+
+    start_after = load_cdc_listing_start_after(etl_status, table)
+    cdc_listing = s3_list_cdc_gz_objects(
+        S3_ARCHIVE,
+        snapshot_prefix,
+        min_ts=etl_status.last_cdc_ts,
+        start_after=start_after,
+        shard_keys=cdc_list_shard_keys(snapshot_prefix, shard_from_ts),
+    )
+    if cdc_listing.safe_start_after != start_after:
+        save_cdc_listing_manifest(
+            CDCListingManifest(
+                snapshot_ts=etl_status.current_snapshot_ts,
+                min_ts=etl_status.last_cdc_ts,
+                start_after=cdc_listing.safe_start_after,
+            ),
+            table,
+        )
+
+    return sorted(cdc_listing.objects, key=lambda obj: re_get_first(obj.key, RE_CDC_TS))
 
 
 def threading_cpu_count() -> int:
     """
     return an integer for the number of work threads to utilize
+
+    can be overridden with QLIK_DOWNLOAD_THREADS environment variable
     """
+    thread_count = env_int("QLIK_DOWNLOAD_THREADS", 0)
+    if thread_count > 0:
+        return thread_count
+
     os_cpu_count = os.cpu_count()
     if os_cpu_count is None:
         return 4
@@ -145,14 +378,28 @@ def threading_cpu_count() -> int:
     return os_cpu_count
 
 
+@lru_cache(maxsize=DFM_CACHE_SIZE)
+def dfm_columns_text(dfm_path: str) -> str:
+    """
+    fetch table schema columns from S3 .dfm path as normalized json text
+
+    results are cached, .dfm objects are not modified once written
+
+    :param dfm_path: S3 path to .dfm file as s3://bucket/object_path
+    """
+    dfm_json = json.load(s3_get_object(dfm_path))
+    return json.dumps(dfm_json["dataInfo"]["columns"], sort_keys=True)
+
+
 def dfm_schema_to_json(dfm_path: str) -> List[DFMSchemaFields]:
     """
     extract table schema from S3 .dfm path as json
 
+    returns new objects on every call, so callers can modify them
+
     :param dfm_path: S3 path to .dfm file as s3://bucket/object_path
     """
-    dfm_json = json.load(s3_get_object(dfm_path))
-    return dfm_json["dataInfo"]["columns"]
+    return json.loads(dfm_columns_text(dfm_path))
 
 
 def dfm_schema_to_df(dfm_path: str) -> pl.DataFrame:
@@ -178,25 +425,70 @@ def status_schema_to_df(status: TableStatus) -> pl.DataFrame:
     )
 
 
-def merge_cdc_csv_gz_files(tmp_dir: str) -> str:
+def copy_file_bytes(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
     """
-    Merge all cdc csv.gz files in tmp_dir, will create MERGED_FNAME file in tmp_dir
+    copy count bytes, starting at offset, from src_fd to current position of dst_fd
 
-    :param tmp_dir: folder containing all csv.gz files to be merged
+    uses kernel-side copies (os.copy_file_range or os.sendfile) where available, so file bytes are
+    not read into python memory
 
-    :return: greatest cdc ts from files in tmp_dir
+    :param src_fd: file descriptor to copy from
+    :param dst_fd: file descriptor to copy to
+    :param offset: position in src_fd to start copying from
+    :param count: number of bytes to copy
+
+    :raises OSError: if src_fd ends before count bytes are copied
+    """
+    end = offset + count
+    try:
+        while offset < end:
+            if hasattr(os, "copy_file_range"):
+                copied = os.copy_file_range(src_fd, dst_fd, end - offset, offset)
+            else:
+                copied = os.sendfile(dst_fd, src_fd, offset, end - offset)
+            if copied == 0:
+                # kernel-side copy stopped short, finish with user-space copy
+                break
+            offset += copied
+    except OSError:
+        # kernel-side copy not supported between these files, fall back to user-space copy
+        pass
+
+    while offset < end:
+        chunk = os.pread(src_fd, min(end - offset, 1024 * 1024), offset)
+        if not chunk:
+            raise OSError(f"source file ended {end - offset} bytes short of {count} bytes to copy")
+        offset += os.write(dst_fd, chunk)
+
+
+def merge_cdc_csv_gz_files(tmp_dir: str, cdc_paths: Optional[List[str]] = None) -> str:
+    """
+    Merge cdc csv.gz files in tmp_dir, will create MERGED_FNAME file in tmp_dir
+
+    header row of first file is kept, header row of all other files is skipped
+    and file body is copied with kernel-side copies
+
+    :param tmp_dir: folder containing csv.gz files to be merged
+    :param cdc_paths: paths of files to merge, all files in tmp_dir if not provided
+
+    :return: greatest cdc ts from merged files
     """
     merge_file = os.path.join(tmp_dir, MERGED_FNAME)
-    cdc_paths = [os.path.join(tmp_dir, f) for f in os.listdir(tmp_dir)]
+    if cdc_paths is None:
+        cdc_paths = [os.path.join(tmp_dir, f) for f in os.listdir(tmp_dir)]
 
     max_ts = ""
     with open(merge_file, "wb") as fout:
         for cdc_path in cdc_paths:
             max_ts = max(max_ts, re_get_first(cdc_path, RE_CDC_TS))
             with open(cdc_path, "rb") as f:
+                body_offset = 0
                 if fout.tell() > 0:
-                    next(f)
-                fout.write(f.read())
+                    f.readline()
+                    body_offset = f.tell()
+                body_bytes = os.fstat(f.fileno()).st_size - body_offset
+                copy_file_bytes(f.fileno(), fout.fileno(), body_offset, body_bytes)
+                fout.seek(0, os.SEEK_END)
 
     return max_ts
 
@@ -240,41 +532,172 @@ def qlik_type_to_polars(field: DFMSchemaFields) -> pl.DataType:
     return return_type
 
 
+@lru_cache(maxsize=DFM_CACHE_SIZE)
+def polars_schema_from_columns_text(columns_text: str) -> pl.Schema:
+    """
+    create polars schema from .dfm columns json text, cached by json text content
+
+    :param columns_text: .dfm columns as json text (see dfm_columns_text)
+
+    :return: polars schema of columns
+    """
+    return pl.Schema({col["name"].lower(): qlik_type_to_polars(col) for col in json.loads(columns_text)})
+
+
 def polars_schema_from_dfm(dfm_path: str) -> pl.Schema:
     """
     create polars schema based on column names and types from dfm_path
 
     :param dfm_path: S3 path to .dfm file as s3://bucket/object_path
 
-    :return: polars schema of dfm_path
+    :return: polars schema of dfm_path (copy of cached schema)
     """
-    return pl.Schema({col["name"].lower(): qlik_type_to_polars(col) for col in dfm_schema_to_json(dfm_path)})
+    return pl.Schema(polars_schema_from_columns_text(dfm_columns_text(dfm_path)))
 
 
-def lf_from_merged_csv(csv_path: str, dfm_path: str) -> pl.LazyFrame:
+def lf_from_merged_csv(csv_path: Union[str, List[str]], dfm_path: str) -> pl.LazyFrame:
     """
-    load csv_path into dataframe with correct types
+    load csv_path (merged csv file, or list of csv files) into dataframe with correct types
     types will be inferred from dfm_path (one .csv.gz file from csv_path)
 
     dataframe drops header__change_oper="B" because they are redundant
 
-    :param csv_path: local path for merged csv file
+    :param csv_path: local path for merged csv file, or list of local csv file paths sharing one header
     :param dfm_path: S3 path to .dfm file as s3://bucket/object_path
 
-    :return: polars dataframe of csv_path file
+    :return: polars dataframe of csv_path file(s)
     """
     schema = polars_schema_from_dfm(dfm_path)
     return pl.scan_csv(csv_path, schema=schema).filter(pl.col("header__change_oper").ne("B"))
 
 
+def cache_cdc_lf(cdc_lf: pl.LazyFrame, csv_paths: List[str], cache_dir: str) -> pl.LazyFrame:
+    """
+    materialize cdc dataframe once, so insert/update/delete phases do not re-parse csv files
+
+    caching mode is set by CDC_FRAME_CACHE, if csv_paths are larger than CDC_FRAME_CACHE_MAX_BYTES
+    cdc_lf is returned un-cached
+
+    :param cdc_lf: lazy cdc dataframe scanning csv_paths
+    :param csv_paths: local csv files scanned by cdc_lf, used to estimate size of dataframe
+    :param cache_dir: folder for CDC_CACHE_FNAME file in "ipc" mode
+
+    :return: cached (or original) cdc dataframe
+    """
+    csv_bytes = sum(os.path.getsize(csv_path) for csv_path in csv_paths)
+    logger = ProcessLogger("cache_cdc_lf", cache_mode=CDC_FRAME_CACHE, csv_bytes=csv_bytes)
+
+    if csv_bytes > CDC_FRAME_CACHE_MAX_BYTES or CDC_FRAME_CACHE not in ("memory", "ipc"):
+        logger.log_complete(cached=False)
+        return cdc_lf
+
+    if CDC_FRAME_CACHE == "ipc":
+        cache_path = os.path.join(cache_dir, CDC_CACHE_FNAME)
+        cdc_lf.sink_ipc(cache_path)
+        logger.log_complete(cached=True)
+        return pl.scan_ipc(cache_path)
+
+    cdc_df = cdc_lf.collect()
+    logger.log_complete(cached=True, estimated_mb=int(cdc_df.estimated_size("mb")))
+    return cdc_df.lazy()
+
+
+def cdc_final_state_lf(cdc_lf: pl.LazyFrame, key_columns: List[str]) -> pl.LazyFrame:
+    """
+    reduce cdc dataframe to one final state record per key
+
+    only records from the last DELETE of a key onwards are considered, final header__change_oper is:
+        "D" if last record of key is a DELETE
+        "I" if key was INSERTED after its last DELETE
+        "U" otherwise
+
+    non-key columns hold the latest non-null INSERT/UPDATE value (by header__change_seq) of each column
+
+    :param cdc_lf: cdc dataframe
+    :param key_columns: primary key columns of table
+
+    :return: dataframe of key_columns, non-key columns and final header__change_oper
+    """
+    value_columns = [
+        col for col in cdc_lf.collect_schema().names() if col not in key_columns and col not in CDC_COLUMNS
+    ]
+    change_oper = pl.col("header__change_oper")
+    change_seq = pl.col("header__change_seq")
+    last_delete_seq = change_seq.filter(change_oper.eq("D")).max().over(key_columns)
+
+    return (
+        cdc_lf.filter(last_delete_seq.is_null() | change_seq.ge(last_delete_seq))
+        .sort(by="header__change_seq")
+        .group_by(key_columns)
+        .agg(
+            pl.col(value_columns).filter(change_oper.ne("D")).drop_nulls().last(),
+            change_oper.last().alias("last_oper"),
+            change_oper.eq("I").any().alias("has_insert"),
+        )
+        .with_columns(
+            pl.when(pl.col("last_oper").eq("D"))
+            .then(pl.lit("D"))
+            .when(pl.col("has_insert"))
+            .then(pl.lit("I"))
+            .otherwise(pl.lit("U"))
+            .alias("header__change_oper")
+        )
+        .drop("last_oper", "has_insert")
+    )
+
+
+def cdc_latest_updates_lf(cdc_lf: pl.LazyFrame, key_columns: List[str]) -> Tuple[pl.LazyFrame, List[str]]:
+    """
+    reduce UPDATE records of cdc dataframe to latest non-null value of every non-key column, per key
+
+    keys without any non-null UPDATE value are dropped
+
+    :param cdc_lf: cdc dataframe
+    :param key_columns: primary key columns of table
+
+    :return: Tuple[dataframe of key_columns and update columns, update columns]
+    """
+    update_cols = [col for col in cdc_lf.collect_schema().names() if col not in key_columns and col not in CDC_COLUMNS]
+    update_lf = (
+        cdc_lf.filter(pl.col("header__change_oper").eq("U"))
+        .sort(by="header__change_seq")
+        .group_by(key_columns)
+        .agg(pl.col(update_cols).drop_nulls().last())
+        .filter(pl.any_horizontal(pl.col(update_cols).is_not_null()))
+    )
+    return (update_lf, update_cols)
+
+
 def key_column_join_type(lf: pl.LazyFrame, key_columns: List[str]) -> List[Tuple[str, str]]:
     """
     Check for NULL counts in key_columns to determine if `=` or `IS NOT DISTINCT FROM` can be used
+
+    NULL counts of all key_columns are computed in a single pass of lf
     """
+    null_counts = lf.select(pl.col(key_columns).null_count()).collect().row(0, named=True)
     return_list = []
     for column in key_columns:
-        if lf.select(column).null_count().collect().item() > 0:
+        if null_counts[column] > 0:
             return_list.append(("IS NOT DISTINCT FROM", column))
         else:
             return_list.append(("=", column))
     return return_list
+
+
+def cdc_date_range(cdc_lf: pl.LazyFrame) -> Optional[Tuple[date, date]]:
+    """
+    header__timestamp date range of cdc records
+
+    "B" records, dropped from cdc_lf, share header__timestamp of their "U" record
+
+    :param cdc_lf: cdc records of load folder
+
+    :return: Tuple[min date, max date] or None if cdc_lf has no header__timestamp values
+    """
+    ts_range = cdc_lf.select(
+        pl.col("header__timestamp").min().alias("min_ts"),
+        pl.col("header__timestamp").max().alias("max_ts"),
+    ).collect()
+    if ts_range["min_ts"][0] is None:
+        return None
+    return (ts_range["min_ts"][0].date(), ts_range["max_ts"][0].date())
@@ -3,7 +3,11 @@ from typing import List
 from typing import Tuple
 from typing import Optional
 from typing import Dict
+from typing import Iterator
+from typing import NamedTuple
+from datetime import datetime
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 from botocore.exceptions import ClientError
@@ -15,6 +19,19 @@ from cubic_loader.utils.logger import ProcessLogger
 
 S3_POOL_COUNT = 50
 
+# max concurrent list_objects_v2 paginators of a sharded listing
+S3_LIST_WORKERS = 16
+
+
+class S3Object(NamedTuple):
+    """Fields of listed S3 object"""
+
+    path: str
+    key: str
+    size: int
+    etag: str
+    last_modified: Optional[datetime]
+
 
 def running_in_aws() -> bool:
     """
@@ -46,6 +63,39 @@ def s3_split_object_path(obj: str) -> Tuple[str, str]:
     return (bucket, key)
 
 
+def s3_iter_objects(
+    bucket: str,
+    prefix: str,
+    start_after: str = "",
+    last_key: Optional[str] = None,
+) -> Iterator[S3Object]:
+    """
+    lazily yield s3 objects of prefix, in key order, as list_objects_v2 pages arrive
+
+    :param bucket: the name of the bucket with objects
+    :param prefix: prefix for objs to return
+    :param start_after: only yield keys after this key
+    :param last_key: stop after this key, no upper bound if None
+
+    :return: Iterator[S3Object]
+    """
+    list_args = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        list_args["StartAfter"] = start_after
+
+    for page in s3_get_client().get_paginator("list_objects_v2").paginate(**list_args):
+        for obj in page.get("Contents", []):
+            if last_key is not None and obj["Key"] > last_key:
+                return
+            yield S3Object(
+                path=os.path.join("s3://", bucket, obj["Key"]),
+                key=obj["Key"],
+                size=obj["Size"],
+                etag=obj.get("ETag", "").strip('"'),
+                last_modified=obj.get("LastModified"),
+            )
+
+
 def s3_list_objects(
     bucket: str,
     prefix: str,
@@ -70,20 +120,12 @@ def s3_list_objects(
         max_objects=max_objects,
     )
     try:
-        s3_client = s3_get_client()
-        paginator = s3_client.get_paginator("list_objects_v2")
-        pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
-
         filepaths = []
-        for page in pages:
-            if page["KeyCount"] == 0:
+        for obj in s3_iter_objects(bucket, prefix):
+            if obj.size == 0:
                 continue
-            for obj in page["Contents"]:
-                if obj["Size"] == 0:
-                    continue
-                if in_filter is None or in_filter in obj["Key"]:
-                    filepaths.append(os.path.join("s3://", bucket, obj["Key"]))
-
+            if in_filter is None or in_filter in obj.key:
+                filepaths.append(obj.path)
             if len(filepaths) >= max_objects:
                 break
 
@@ -95,6 +137,57 @@ def s3_list_objects(
         return []
 
 
+def s3_list_key_range(
+    bucket: str,
+    prefix: str,
+    start_after: str = "",
+    last_key: Optional[str] = None,
+) -> List[S3Object]:
+    """
+    list s3 objects of prefix with keys after start_after, up to and including last_key
+
+    paginator stops as soon as a key past last_key is found
+
+    :param bucket: the name of the bucket with objects
+    :param prefix: prefix for objs to return
+    :param start_after: only list keys after this key
+    :param last_key: last key of range, no upper bound if None
+
+    :return: List[S3Object] in key order
+    """
+    return list(s3_iter_objects(bucket, prefix, start_after, last_key))
+
+
+def s3_list_sharded(
+    bucket: str,
+    prefix: str,
+    shard_keys: List[str],
+    start_after: str = "",
+) -> List[S3Object]:
+    """
+    list s3 objects of prefix concurrently, with key space split into ranges at shard_keys
+
+    each key range is listed by its own paginator on the pooled s3 client, ranges cover the whole
+    key space after start_after, so shard_keys only affect speed and never which keys are listed
+
+    :param bucket: the name of the bucket with objects
+    :param prefix: prefix for objs to return
+    :param shard_keys: keys that end each key range (do not have to exist)
+    :param start_after: only list keys after this key
+
+    :return: List[S3Object] in key order
+    """
+    range_starts = [start_after] + sorted(set(key for key in shard_keys if key > start_after))
+    range_ends: List[Optional[str]] = [*range_starts[1:], None]
+
+    with ThreadPoolExecutor(max_workers=min(S3_LIST_WORKERS, len(range_starts))) as pool:
+        shards = pool.map(
+            lambda key_range: s3_list_key_range(bucket, prefix, *key_range),
+            zip(range_starts, range_ends),
+        )
+        return [obj for shard in shards for obj in shard]
+
+
 def s3_object_exists(obj: str) -> bool:
     """
     check if s3 object exists
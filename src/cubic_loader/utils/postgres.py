@@ -2,9 +2,14 @@ import os
 import time
 import gzip
 import platform
-import subprocess
 import urllib.parse as urlparse
+from contextlib import closing
+from contextlib import contextmanager
+from contextlib import ExitStack
+from multiprocessing.synchronize import Semaphore
 from typing import Any
+from typing import IO
+from typing import Iterator
 from typing import Optional
 from typing import Dict
 from typing import List
@@ -14,7 +19,7 @@ from typing import Union
 import boto3
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import Session
 from sqlalchemy.sql.expression import TextClause
 from sqlalchemy.sql.schema import Table
 from sqlalchemy.engine import CursorResult
@@ -22,8 +27,63 @@ from alembic.config import Config
 from alembic import command
 
 from cubic_loader.utils.aws import running_in_aws
+from cubic_loader.utils.aws import s3_get_object
 from cubic_loader.utils.logger import ProcessLogger
 
+# read size used when streaming csv data into COPY ... FROM STDIN
+COPY_BUFFER_BYTES = 1024 * 1024
+
+# connection pool settings of DatabaseManager engine
+DB_POOL_SIZE = 3
+DB_MAX_OVERFLOW = 2
+
+# shared semaphore limiting concurrent COPY sessions across loader processes
+COPY_SESSION_SEMAPHORE: Optional[Semaphore] = None
+
+# seconds to wait for a free COPY session slot, None to wait forever
+COPY_SESSION_TIMEOUT: Optional[float] = None
+
+
+def set_copy_session_semaphore(semaphore: Optional[Semaphore], timeout: Optional[float] = None) -> None:
+    """
+    set semaphore used to cap the number of concurrent COPY sessions
+
+    semaphore is created by the parent process and passed to each spawned loader process
+
+    :param semaphore: multiprocessing semaphore shared between processes (None disables cap)
+    :param timeout: seconds to wait for a free COPY session slot (None waits forever)
+    """
+    global COPY_SESSION_SEMAPHORE, COPY_SESSION_TIMEOUT  # pylint: disable=global-statement
+    COPY_SESSION_SEMAPHORE = semaphore
+    COPY_SESSION_TIMEOUT = timeout
+
+
+@contextmanager
+def copy_session_slot() -> Iterator[None]:
+    """
+    hold one COPY session slot for the duration of the context
+
+    slots held by a killed loader process are never released, so waiting for a slot fails after
+    COPY_SESSION_TIMEOUT seconds instead of blocking forever
+
+    no-op if no COPY session semaphore has been set for this process
+    """
+    if COPY_SESSION_SEMAPHORE is None:
+        yield
+        return
+
+    if not COPY_SESSION_SEMAPHORE.acquire(timeout=COPY_SESSION_TIMEOUT):
+        exception = TimeoutError(
+            f"no COPY session slot free after {COPY_SESSION_TIMEOUT} seconds, "
+            "slots may be held by a killed loader process"
+        )
+        ProcessLogger("copy_session_slot", timeout_seconds=COPY_SESSION_TIMEOUT).log_failure(exception)
+        raise exception
+    try:
+        yield
+    finally:
+        COPY_SESSION_SEMAPHORE.release()
+
 
 def running_in_docker() -> bool:
     """
@@ -159,8 +219,8 @@ def get_local_engine(
             future=True,
             pool_pre_ping=True,
             pool_use_lifo=True,
-            pool_size=3,
-            max_overflow=2,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
             connect_args={
                 "keepalives": 1,
                 "keepalives_idle": 60,
@@ -239,28 +299,59 @@ class DatabaseManager:
         """
         return self.session
 
-    def execute(self, statement: PreAnyQuery) -> CursorResult:
+    @contextmanager
+    def session_scope(self) -> Iterator[Session]:
+        """
+        session for running multiple statements on one pooled connection, in one transaction
+
+        transaction is committed when context exits, or rolled back if an exception is raised
+
+        session can be passed to execute, select and copy methods
+        """
+        with self.session() as session:
+            try:
+                yield session
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+    @contextmanager
+    def _use_session(self, session: Optional[Session]) -> Iterator[Session]:
+        """
+        use provided session without committing, or create new session that commits on exit
+        """
+        if session is not None:
+            yield session
+            return
+
+        with self.session() as new_session:
+            yield new_session
+            new_session.commit()
+
+    def execute(self, statement: PreAnyQuery, session: Optional[Session] = None) -> CursorResult:
         """
         execute SQL Statement with no return data
 
         :param statement: SQL Statement to execute
+        :param session: session from session_scope to execute in, new session is committed if not provided
         """
         statement = self._to_text_any(statement)
-        with self.session() as cursor:
+        with self._use_session(session) as cursor:
             result: CursorResult = cursor.execute(statement)  # type: ignore
-            cursor.commit()
         return result
 
-    def select(self, query: PreSelectQuery) -> Dict[str, Any]:
+    def select(self, query: PreSelectQuery, session: Optional[Session] = None) -> Dict[str, Any]:
         """
         execute SQL SELECT Query and return first result as dictionary
 
         :param query: SQL SELECT Query to execute
+        :param session: session from session_scope to execute in
         :return: first result as dictionary or None if no result
         """
         query = self._to_text_select(query)
 
-        with self.session() as cursor:
+        with self._use_session(session) as cursor:
             result = cursor.execute(query)
             first = result.first()
         if first is None:
@@ -287,6 +378,60 @@ class DatabaseManager:
             cursor.execute(sa.text(f"VACUUM (ANALYZE) {table_as};"))
             cursor.commit()
 
+    def analyze(self, table: Any) -> None:
+        """RUN ANALYZE on table"""
+        table_as = self._get_schema_table(table)
+        self.execute(f"ANALYZE {table_as};")
+
+    def maintain_table(self, table: str, vacuum_dead_pct: int = 10, analyze_modified_pct: int = 10) -> str:
+        """
+        RUN VACUUM (ANALYZE) or ANALYZE on table only if needed, based on pg_stat_user_tables
+
+        VACUUM (ANALYZE) if dead tuples are more than vacuum_dead_pct percent of live tuples
+        ANALYZE if rows modified since last analyze are more than analyze_modified_pct percent of live tuples
+        otherwise skip, action taken (or skipped) is logged
+
+        :param table: table as 'schema.table'
+        :param vacuum_dead_pct: dead tuple threshold percent for VACUUM (ANALYZE)
+        :param analyze_modified_pct: modified row threshold percent for ANALYZE
+
+        :return: action taken as "vacuum_analyze", "analyze" or "skip"
+        """
+        schema, relname = table.lower().split(".", 1)
+        log = ProcessLogger(
+            "table_maintenance",
+            table=table,
+            vacuum_dead_pct=vacuum_dead_pct,
+            analyze_modified_pct=analyze_modified_pct,
+        )
+        stats = self.select(
+            "SELECT n_live_tup, n_dead_tup, n_mod_since_analyze FROM pg_stat_user_tables "
+            f"WHERE schemaname='{schema}' AND relname='{relname}';"
+        )
+        if "none" in stats:
+            log.log_complete(action="skip", reason="no_table_stats")
+            return "skip"
+
+        live_tuples = max(int(stats["n_live_tup"]), 1)
+        dead_pct = 100 * int(stats["n_dead_tup"]) / live_tuples
+        modified_pct = 100 * int(stats["n_mod_since_analyze"]) / live_tuples
+
+        action = "skip"
+        if dead_pct > vacuum_dead_pct:
+            action = "vacuum_analyze"
+            self.vaccuum_analyze(table)
+        elif modified_pct > analyze_modified_pct:
+            action = "analyze"
+            self.analyze(table)
+
+        log.log_complete(
+            action=action,
+            n_live_tup=stats["n_live_tup"],
+            n_dead_tup=stats["n_dead_tup"],
+            n_mod_since_analyze=stats["n_mod_since_analyze"],
+        )
+        return action
+
     def truncate_table(
         self,
         table: Any,
@@ -358,126 +503,227 @@ class DatabaseManager:
             self.execute(f'REFRESH MATERIALIZED VIEW {schema}."{mat_view_name}";')
             log.log_complete()
 
+    def copy_stream(  # pylint: disable=too-many-arguments
+        self,
+        stream: Any,
+        destination_table: str,
+        column_str: str,
+        header: bool = True,
+        *,
+        session: Optional[Session] = None,
+        where: Optional[str] = None,
+    ) -> int:
+        """
+        COPY csv stream into table with `COPY ... FROM STDIN` on a pooled engine connection
 
-def copy_local_to_db(local_path: str, destination_table: DeclarativeBase) -> None:
-    """
-    Load local file into DB using psql COPY command
-    will throw if psql command does not exit with code 0
-
-    :param local_path: path to local file that will be loaded
-    :param destination_table: SQLAlchemy table object for COPY destination
-    """
-    copy_log = ProcessLogger(
-        "psql_copy",
-        destination_table=str(destination_table.__table__),
-    )
+        :param stream: binary file-like object producing csv bytes
+        :param destination_table: table name for COPY destination
+        :param column_str: columns in the order they occur in stream as comma-seperated string
+        :param header: True if first line of stream is a header row to be skipped
+        :param session: session from session_scope to COPY in, new session is committed if not provided
+        :param where: condition rows must meet to be COPY'd, all rows are COPY'd if not provided
 
-    with gzip.open(local_path, "rt") as gzip_file:
-        local_columns = gzip_file.readline().strip().lower().split(",")
+        :return: number of rows copied
+        """
+        copy_query = f"COPY {destination_table} ({column_str}) FROM STDIN WITH CSV"
+        if header:
+            copy_query = f"{copy_query} HEADER"
+        if where is not None:
+            copy_query = f"{copy_query} WHERE {where}"
 
-    copy_command = (
-        f"\\COPY {destination_table.__table__} "
-        f"({','.join(local_columns)}) "
-        "FROM PROGRAM "
-        f"'gzip -dc {local_path}' "
-        "WITH CSV HEADER"
-    )
+        with copy_session_slot(), self._use_session(session) as cursor:
+            with closing(cursor.connection().connection.cursor()) as dbapi_cursor:
+                dbapi_cursor.copy_expert(copy_query, stream, size=COPY_BUFFER_BYTES)
+                row_count: int = dbapi_cursor.rowcount
 
-    psql = [
-        "psql",
-        f"postgresql://{create_db_connection_string()}",
-        "-c",
-        f"{copy_command}",
-    ]
+        return row_count
 
-    process_result = subprocess.run(psql, check=True)
+    def copy_csv_files(
+        self,
+        csv_paths: List[str],
+        destination_table: str,
+        session: Optional[Session] = None,
+        where: Optional[str] = None,
+    ) -> int:
+        """
+        load list of local csv files into DB with a single in-process COPY
 
-    copy_log.add_metadata(exit_code=process_result.returncode)
-    copy_log.log_complete()
+        files are streamed one after another into `COPY ... FROM STDIN`, columns are pulled from the
+        header row of the first file and all files are expected to share the same header
 
+        :param csv_paths: paths of local csv files that will be loaded
+        :param destination_table: table name for COPY destination
+        :param session: session from session_scope to COPY in
+        :param where: condition rows must meet to be COPY'd, all rows are COPY'd if not provided
 
-def header_from_csv_gz(obj_path: str) -> str:
-    """
-    extract header columns from local or remote csv.gz file
-    """
-    if obj_path.lower().startswith("s3://"):
-        s3_cmd = "aws s3 cp " f"{obj_path} - " "| gzip -dc " "| head -n 1"
-        ps = subprocess.run(
-            s3_cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=True,
+        :return: number of rows copied
+        """
+        copy_log = ProcessLogger(
+            "copy_csv_files",
+            file_count=len(csv_paths),
+            destination_table=destination_table,
         )
-        header_str = ps.stdout
-    elif obj_path.lower().endswith(".csv"):
-        with open(obj_path, "rt", encoding="utf8") as csv_file:
-            header_str = csv_file.readline()
-    else:
-        with gzip.open(obj_path, "rt") as gzip_file:
-            header_str = gzip_file.readline()
+        try:
+            start_time = time.monotonic()
+            with open(csv_paths[0], "rt", encoding="utf8") as csv_file:
+                column_str = clean_csv_header(csv_file.readline())
+
+            with closing(CsvFilesReader(csv_paths)) as reader:
+                row_count = self.copy_stream(
+                    reader, destination_table, column_str, header=False, session=session, where=where
+                )
+
+            duration = max(time.monotonic() - start_time, 0.001)
+            copy_log.log_complete(
+                rows=row_count,
+                bytes=reader.bytes_read,
+                bytes_per_sec=int(reader.bytes_read / duration),
+            )
+            return row_count
 
-    return header_str.strip().lower().replace('"', "")
+        except Exception as exception:
+            copy_log.log_failure(exception)
+            raise exception
 
+    def copy_csv(
+        self,
+        obj_path: str,
+        destination_table: str,
+        column_str: Optional[str] = None,
+        gzipped: Optional[bool] = None,
+        session: Optional[Session] = None,
+    ) -> int:
+        """
+        load local (or s3 remote) csv or csv.gz file into DB with in-process COPY
 
-def remote_csv_gz_copy(obj_path: str, destination_table: str, column_str: Optional[str] = None) -> None:
-    """
-    load local (or s3 remote) csv.gz file into DB using psql COPY command
+        file is streamed, and decompressed on the fly if .gz, straight into `COPY ... FROM STDIN`
+
+        correct headers can to be provided, otherwise they will be pulled from the first row of obj_path
 
-    correct headers can to be provided, otherwise they will be pulled from the first row of obj_path
+        :param obj_path: local path or s3 path of file that will be loaded
+        :param destination_table: table name for COPY destination
+        :param column_str: columns in the order they occur in obj_path as comma-seperated string
+        :param gzipped: True if obj_path is gzip compressed, inferred from .gz extension if not provided
+        :param session: session from session_scope to COPY in
 
-    will throw if psql command does not exit with code 0
+        :return: number of rows copied
+        """
+        copy_log = ProcessLogger(
+            "copy_csv",
+            obj_path=obj_path,
+            destination_table=destination_table,
+        )
+        try:
+            start_time = time.monotonic()
+            with open_csv_stream(obj_path, gzipped) as stream:
+                reader = CountingReader(stream)
+                header = True
+                if column_str is None:
+                    column_str = clean_csv_header(reader.readline().decode("utf8"))
+                    header = False
+                row_count = self.copy_stream(reader, destination_table, column_str, header=header, session=session)
+
+            duration = max(time.monotonic() - start_time, 0.001)
+            copy_log.log_complete(
+                rows=row_count,
+                bytes=reader.bytes_read,
+                bytes_per_sec=int(reader.bytes_read / duration),
+            )
+            return row_count
+
+        except Exception as exception:
+            copy_log.log_failure(exception)
+            raise exception
 
-    :param local_path: path to local file that will be loaded
-    :param destination_table: table name for COPY destination
-    :param column_str: columns in the order they occur in obj_path as comma-seperated string
+
+class CountingReader:
+    """
+    binary file-like wrapper that counts bytes read from stream
     """
-    copy_log = ProcessLogger(
-        "remote_csv_gz_copy",
-        obj_path=obj_path,
-        destination_table=destination_table,
-    )
 
-    if column_str is None:
-        column_str = header_from_csv_gz(obj_path)
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+        self.bytes_read = 0
 
-    copy_from = f"FROM {obj_path} "
-    if obj_path.lower().startswith("s3://") and obj_path.lower().endswith(".gz"):
-        copy_from = f"FROM PROGRAM 'aws s3 cp {obj_path} - | gzip -dc' "
-    elif obj_path.lower().endswith(".gz"):
-        copy_from = f"FROM PROGRAM 'gzip -dc {obj_path}' "
+    def read(self, size: int = -1) -> bytes:
+        """read up to size bytes from stream"""
+        chunk = self.stream.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
 
-    copy_command = f"\\COPY {destination_table} ({column_str}) {copy_from} WITH CSV HEADER"
+    def readline(self, size: int = -1) -> bytes:
+        """read one line from stream"""
+        line = self.stream.readline(size)
+        self.bytes_read += len(line)
+        return line
 
-    psql = [
-        "psql",
-        f"postgresql://{create_db_connection_string()}",
-        "-c",
-        f"{copy_command}",
-    ]
 
-    run_psql_subprocess(psql, copy_log, max_retries=0)
+class CsvFilesReader:
+    """
+    binary file-like object reading local csv files one after another as a single csv stream
 
+    header row of every file is skipped, all files are expected to share the same header
+    """
 
-def run_psql_subprocess(psql_cmd: List[str], logger: ProcessLogger, max_retries: int = 2) -> None:
+    def __init__(self, csv_paths: List[str]) -> None:
+        self.csv_paths = list(csv_paths)
+        self.current: Optional[IO[bytes]] = None
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """read up to size bytes from current file, moving on to next file when exhausted"""
+        while True:
+            if self.current is None:
+                if not self.csv_paths:
+                    return b""
+                self.current = open(self.csv_paths.pop(0), "rb")  # pylint: disable=consider-using-with
+                self.current.readline()
+
+            chunk = self.current.read(size)
+            if chunk:
+                self.bytes_read += len(chunk)
+                return chunk
+
+            self.current.close()
+            self.current = None
+
+    def close(self) -> None:
+        """close currently open file"""
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+
+@contextmanager
+def open_csv_stream(obj_path: str, gzipped: Optional[bool] = None) -> Iterator[IO[bytes]]:
     """
-    run psql command with retry logic
+    open local (or s3 remote) csv or csv.gz file as binary stream
+
+    gzip files are decompressed on the fly
+
+    :param obj_path: local path or s3 path of file to open
+    :param gzipped: True if file is gzip compressed, inferred from .gz extension if not provided
     """
-    logger.add_metadata(max_retries=max_retries)
+    if gzipped is None:
+        gzipped = obj_path.lower().endswith(".gz")
 
-    for retry_attempts in range(max_retries + 1):
-        try:
-            logger.add_metadata(retry_attempts=retry_attempts)
-            process_result = subprocess.run(psql_cmd, check=True)
-            break
-        except Exception as exception:
-            if retry_attempts == max_retries:
-                logger.log_failure(exception=exception)
-                raise exception
-            time.sleep(5)
+    with ExitStack() as stack:
+        if obj_path.lower().startswith("s3://"):
+            stream: Any = stack.enter_context(closing(s3_get_object(obj_path)))
+        else:
+            stream = stack.enter_context(open(obj_path, "rb"))
+
+        if gzipped:
+            stream = stack.enter_context(gzip.GzipFile(fileobj=stream, mode="rb"))
 
-    logger.add_metadata(exit_code=process_result.returncode)
-    logger.log_complete()
+        yield stream
+
+
+def clean_csv_header(header_str: str) -> str:
+    """
+    normalize csv header row to lowercase comma-seperated column names
+    """
+    return header_str.strip().lower().replace('"', "")
 
 
 def get_alembic_config() -> Config:
@@ -1,4 +1,6 @@
 import os
+import sys
+import resource
 from typing import List
 from typing import Optional
 
@@ -63,3 +65,49 @@ def validate_environment(
         raise exception
 
     process_logger.log_complete()
+
+
+def env_int(key: str, default: int) -> int:
+    """
+    read integer value from environment variable
+
+    :param key: environment variable name
+    :param default: value returned if environment variable is not set
+
+    :return: environment variable value as int
+    """
+    value = os.environ.get(key, None)
+    if value is None or value.strip() == "":
+        return default
+
+    return int(value)
+
+
+def env_bool(key: str, default: bool) -> bool:
+    """
+    read boolean flag from environment variable
+
+    "1", "true", "yes" and "on" (case-insensitive) are read as True
+
+    :param key: environment variable name
+    :param default: value returned if environment variable is not set
+
+    :return: environment variable value as bool
+    """
+    value = os.environ.get(key, None)
+    if value is None or value.strip() == "":
+        return default
+
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def peak_rss_mb() -> int:
+    """
+    peak resident set size of the current process in megabytes
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on linux
+    if sys.platform == "darwin":
+        return int(max_rss / (1024 * 1024))
+
+    return int(max_rss / 1024)
@@ -0,0 +1,53 @@
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+
+import pytest
+
+from cubic_loader.utils import aws
+
+
+class StubPaginator:  # pylint: disable=too-few-public-methods
+    """list_objects_v2 paginator over in-memory keys, with pages of 2 objects"""
+
+    def __init__(self, keys: List[str], calls: List[Dict[str, Any]]) -> None:
+        self.keys = sorted(keys)
+        self.calls = calls
+
+    def paginate(self, **list_args: Any) -> Iterator[Dict[str, Any]]:
+        """yield pages of keys matching Prefix and StartAfter of list_args"""
+        self.calls.append(list_args)
+        keys = [
+            key for key in self.keys if key.startswith(list_args["Prefix"]) and key > list_args.get("StartAfter", "")
+        ]
+        for page_start in range(0, len(keys), 2):
+            yield {"Contents": [{"Key": key, "Size": 10} for key in keys[page_start : page_start + 2]]}
+
+
+class StubS3Client:  # pylint: disable=too-few-public-methods
+    """s3 client that only supports list_objects_v2 paginators"""
+
+    def __init__(self, keys: List[str]) -> None:
+        self.keys = keys
+        self.calls: List[Dict[str, Any]] = []
+
+    def get_paginator(self, operation: str) -> StubPaginator:
+        """paginator of list_objects_v2"""
+        assert operation == "list_objects_v2"
+        return StubPaginator(self.keys, self.calls)
+
+
+@pytest.fixture
+def stub_s3_keys(monkeypatch: pytest.MonkeyPatch) -> Callable[[List[str]], StubS3Client]:
+    """
+    replace s3 client with StubS3Client listing keys
+    """
+
+    def stub(keys: List[str]) -> StubS3Client:
+        client = StubS3Client(keys)
+        monkeypatch.setattr(aws, "s3_get_client", lambda: client)
+        return client
+
+    return stub
@@ -0,0 +1,46 @@
+from typing import Any
+from typing import Callable
+from typing import List
+
+from cubic_loader.utils.aws import s3_list_key_range
+from cubic_loader.utils.aws import s3_list_sharded
+
+PREFIX = "cubic/ods_qlik/EDW.TABLE__ct/"
+
+KEYS = [f"{PREFIX}202401{day:02}-000000001.csv.gz" for day in range(1, 11)]
+
+
+def test_s3_list_sharded_matches_serial_listing(stub_s3_keys: Callable[[List[str]], Any]) -> None:
+    """
+    assert that sharded listing covers exactly the keys of a serial listing, for any shard keys
+    """
+    stub_s3_keys([*KEYS, "cubic/ods_qlik/EDW.OTHER__ct/20240105-000000001.csv.gz"])
+
+    shard_key_sets = [
+        [],
+        [f"{PREFIX}20240104"],
+        [f"{PREFIX}20240104", f"{PREFIX}20240102", f"{PREFIX}20240104"],
+        [KEYS[3], KEYS[4], KEYS[9]],
+        [f"{PREFIX}20231201", f"{PREFIX}20240301", KEYS[0]],
+    ]
+    for start_after in ("", KEYS[0], KEYS[5], KEYS[9]):
+        serial_keys = [obj.key for obj in s3_list_key_range("bucket", PREFIX, start_after)]
+        assert serial_keys == [key for key in KEYS if key > start_after]
+        for shard_keys in shard_key_sets:
+            sharded_keys = [obj.key for obj in s3_list_sharded("bucket", PREFIX, shard_keys, start_after)]
+            assert sharded_keys == serial_keys, (start_after, shard_keys)
+
+
+def test_s3_list_sharded_ranges(stub_s3_keys: Callable[[List[str]], Any]) -> None:
+    """
+    assert that every key range is listed by its own paginator, starting after the previous shard key
+    """
+    client = stub_s3_keys(KEYS)
+
+    s3_list_sharded("bucket", PREFIX, [f"{PREFIX}20240107", f"{PREFIX}20240104", KEYS[0]], KEYS[1])
+
+    assert sorted(call.get("StartAfter", "") for call in client.calls) == [
+        KEYS[1],
+        f"{PREFIX}20240104",
+        f"{PREFIX}20240107",
+    ]
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+from polars.exceptions import PanicException
+
+from cubic_loader.qlik.cdc_download import CDCFolderLoader
+
+
+def add_folder_files(loader: CDCFolderLoader, folder: Path, count: int, csv_bytes: int = 10) -> None:
+    """
+    add `count` downloaded cdc files of `csv_bytes` each to hash folder of loader
+    """
+    folder.mkdir(exist_ok=True)
+    for num in range(count):
+        csv_path = folder / f"cdc_{num}.csv"
+        csv_path.write_bytes(b"x" * csv_bytes)
+        loader.add_cdc_file((str(csv_path), csv_bytes))
+
+
+def test_loader_loads_folders_in_order(tmp_path: Path) -> None:
+    """
+    assert that queued hash folders are loaded in queue order, and disk bytes are released after load
+    """
+    loaded: List[str] = []
+
+    def load_folder(load_folder: str, load_files: List[str]) -> None:
+        loaded.append(os.path.basename(load_folder))
+        assert load_files == sorted(load_files)
+
+    loader = CDCFolderLoader(load_folder)
+    add_folder_files(loader, tmp_path / "a", 3)
+    add_folder_files(loader, tmp_path / "b", 2)
+    assert loader.disk_bytes == 50
+
+    loader.wait_for_disk(disk_budget=10)
+    loader.finish()
+
+    assert loaded == ["a", "b"]
+    assert loader.disk_bytes == 0
+
+
+def test_loader_panic_is_raised_on_caller(tmp_path: Path) -> None:
+    """
+    assert that a folder load raising a BaseException (polars PanicException) does not leave callers
+    waiting forever, remaining folders are skipped and exception is re-raised on caller thread
+    """
+    loaded: List[str] = []
+
+    def load_folder(load_folder: str, _load_files: List[str]) -> None:
+        loaded.append(os.path.basename(load_folder))
+        raise PanicException("polars panic")
+
+    loader = CDCFolderLoader(load_folder)
+    add_folder_files(loader, tmp_path / "a", 3)
+    add_folder_files(loader, tmp_path / "b", 2)
+
+    with pytest.raises(PanicException):
+        loader.wait_for_disk(disk_budget=50, reserve_bytes=10)
+
+    with pytest.raises(PanicException):
+        loader.check_folders()
+
+    with pytest.raises(PanicException):
+        loader.finish()
+
+    assert loaded == ["a"]
+    assert loader.queued_folders == 0
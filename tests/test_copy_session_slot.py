@@ -0,0 +1,40 @@
+from multiprocessing import get_context
+
+import pytest
+
+from cubic_loader.utils.postgres import copy_session_slot
+from cubic_loader.utils.postgres import set_copy_session_semaphore
+
+
+def test_copy_session_slot_released() -> None:
+    """
+    assert that a COPY session slot is released when the context exits, with or without error
+    """
+    semaphore = get_context("spawn").BoundedSemaphore(1)
+    set_copy_session_semaphore(semaphore, timeout=0.1)
+    try:
+        with copy_session_slot():
+            pass
+        with pytest.raises(ValueError):
+            with copy_session_slot():
+                raise ValueError("copy failed")
+        with copy_session_slot():
+            pass
+    finally:
+        set_copy_session_semaphore(None)
+
+
+def test_copy_session_slot_timeout() -> None:
+    """
+    assert that waiting for a COPY session slot lost by a killed process fails instead of blocking forever
+    """
+    semaphore = get_context("spawn").BoundedSemaphore(1)
+    # slot held by a process that never releases it
+    semaphore.acquire()
+    set_copy_session_semaphore(semaphore, timeout=0.1)
+    try:
+        with pytest.raises(TimeoutError):
+            with copy_session_slot():
+                pass
+    finally:
+        set_copy_session_semaphore(None)
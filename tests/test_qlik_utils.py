@@ -0,0 +1,192 @@
+import os
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import polars as pl
+import pytest
+
+from cubic_loader.qlik.utils import cdc_final_state_lf
+from cubic_loader.qlik.utils import cdc_latest_updates_lf
+from cubic_loader.qlik.utils import copy_file_bytes
+from cubic_loader.qlik.utils import merge_cdc_csv_gz_files
+from cubic_loader.qlik.utils import s3_list_cdc_gz_objects
+from cubic_loader.qlik.utils import MERGED_FNAME
+
+
+def copy_bytes(tmp_path: Path, data: bytes, offset: int, count: int) -> bytes:
+    """
+    copy_file_bytes between two files in tmp_path and return bytes of destination file
+    """
+    src_path = tmp_path / "src.csv"
+    dst_path = tmp_path / "dst.csv"
+    src_path.write_bytes(data)
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        copy_file_bytes(src.fileno(), dst.fileno(), offset, count)
+    return dst_path.read_bytes()
+
+
+def test_copy_file_bytes(tmp_path: Path) -> None:
+    """
+    assert that copy_file_bytes copies count bytes from offset
+    """
+    assert copy_bytes(tmp_path, b"header\nrow1\nrow2\n", 7, 10) == b"row1\nrow2\n"
+
+
+def test_copy_file_bytes_kernel_copy_short(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    assert that user-space copy finishes the copy when kernel-side copy stops short
+    """
+
+    def copy_nothing(*_args: Any) -> int:
+        return 0
+
+    monkeypatch.setattr(os, "copy_file_range", copy_nothing, raising=False)
+    monkeypatch.setattr(os, "sendfile", copy_nothing)
+    assert copy_bytes(tmp_path, b"header\nrow1\nrow2\n", 7, 10) == b"row1\nrow2\n"
+
+
+def test_copy_file_bytes_source_short(tmp_path: Path) -> None:
+    """
+    assert that copying more bytes than source file holds raises instead of truncating silently
+    """
+    with pytest.raises(OSError):
+        copy_bytes(tmp_path, b"header\nrow1\n", 7, 20)
+
+
+def test_merge_cdc_csv_gz_files(tmp_path: Path) -> None:
+    """
+    assert that merged file keeps header row of first file only, and returns greatest cdc ts
+    """
+    cdc_paths = []
+    for num, ts in enumerate(("20240101-000000001", "20240102-000000002")):
+        cdc_path = tmp_path / f"{ts}.csv"
+        cdc_path.write_bytes(f"a,b\n{num},x\n".encode())
+        cdc_paths.append(str(cdc_path))
+
+    assert merge_cdc_csv_gz_files(str(tmp_path), cdc_paths) == "20240102-000000002"
+    assert (tmp_path / MERGED_FNAME).read_bytes() == b"a,b\n0,x\n1,x\n"
+
+
+def cdc_lf(records: List[tuple]) -> pl.LazyFrame:
+    """
+    cdc dataframe of (header__change_oper, id, value) records, in header__change_seq order
+    """
+    return pl.LazyFrame(
+        {
+            "header__change_seq": [str(seq).zfill(4) for seq in range(len(records))],
+            "header__change_oper": [oper for oper, _, _ in records],
+            "header__timestamp": [None] * len(records),
+            "id": [key for _, key, _ in records],
+            "value": [value for _, _, value in records],
+        },
+        schema_overrides={"id": pl.Int64, "value": pl.String, "header__timestamp": pl.Datetime},
+    )
+
+
+def final_state(records: List[tuple]) -> Dict[Optional[int], tuple]:
+    """
+    cdc_final_state_lf of records as {id: (header__change_oper, value)}
+    """
+    final_df = cdc_final_state_lf(cdc_lf(records), ["id"]).collect()
+    assert final_df.columns == ["id", "value", "header__change_oper"]
+    return {row["id"]: (row["header__change_oper"], row["value"]) for row in final_df.iter_rows(named=True)}
+
+
+def test_cdc_final_state_single_operations() -> None:
+    """
+    assert that single I, U and D records keep their operation and values
+    """
+    assert final_state([("I", 1, "a"), ("U", 2, "b"), ("D", 3, None)]) == {
+        1: ("I", "a"),
+        2: ("U", "b"),
+        3: ("D", None),
+    }
+
+
+def test_cdc_final_state_delete_then_insert() -> None:
+    """
+    assert that a key INSERTED after a DELETE is an INSERT of values after the DELETE only
+    """
+    assert final_state([("U", 1, "old"), ("D", 1, None), ("I", 1, None), ("U", 1, "new")]) == {1: ("I", "new")}
+    assert final_state([("U", 1, "old"), ("D", 1, None), ("I", 1, None)]) == {1: ("I", None)}
+
+
+def test_cdc_final_state_insert_then_delete() -> None:
+    """
+    assert that a key DELETED after its INSERT is a DELETE
+    """
+    assert final_state([("I", 1, "a"), ("U", 1, "b"), ("D", 1, None)]) == {1: ("D", None)}
+
+
+def test_cdc_final_state_insert_then_update_with_nulls() -> None:
+    """
+    assert that NULL UPDATE values do not replace earlier INSERT/UPDATE values
+    """
+    assert final_state([("I", 1, "a"), ("U", 1, None)]) == {1: ("I", "a")}
+    assert final_state([("I", 1, "a"), ("U", 1, "b"), ("U", 1, None)]) == {1: ("I", "b")}
+    assert final_state([("U", 1, "a"), ("U", 1, None)]) == {1: ("U", "a")}
+
+
+def test_cdc_final_state_null_keys() -> None:
+    """
+    assert that NULL key values are grouped as their own key
+    """
+    assert final_state([("I", None, "a"), ("U", 1, "b"), ("U", None, "c")]) == {
+        None: ("I", "c"),
+        1: ("U", "b"),
+    }
+    assert final_state([("I", None, "a"), ("D", None, None), ("U", 1, "b")]) == {
+        None: ("D", None),
+        1: ("U", "b"),
+    }
+
+
+def test_cdc_latest_updates() -> None:
+    """
+    assert that UPDATE records are reduced to latest non-null value per key, ignoring INSERT and DELETE records
+    """
+    records = [
+        ("U", 1, "a"),
+        ("U", 1, "b"),
+        ("U", 1, None),
+        ("I", 2, "c"),
+        ("U", 3, None),
+        ("D", 4, None),
+        ("U", None, "d"),
+    ]
+    update_lf, update_cols = cdc_latest_updates_lf(cdc_lf(records), ["id"])
+
+    assert update_cols == ["value"]
+    assert update_lf.sort("id").collect().rows() == [(None, "d"), (1, "b")]
+
+
+def test_s3_list_cdc_gz_objects_safe_start_after(stub_s3_keys: Callable[[List[str]], Any]) -> None:
+    """
+    assert that safe StartAfter key is the last listed key before the first cdc object newer than min_ts
+    """
+    prefix = "cubic/ods_qlik/EDW.TABLE__ct/"
+    keys = [
+        f"{prefix}20240101-000000001.csv.gz",
+        f"{prefix}20240102-000000001.csv.gz",
+        f"{prefix}20240102-000000001.dfm",
+        f"{prefix}20240103-000000001.csv.gz",
+        f"{prefix}20240103-000000002.dfm",
+        f"{prefix}20240104-000000001.csv.gz",
+    ]
+    stub_s3_keys([*keys, "cubic/ods_qlik/EDW.OTHER__ct/20240103-000000001.csv.gz"])
+
+    listing = s3_list_cdc_gz_objects("bucket", prefix, min_ts="20240102-000000001")
+    assert [obj.key for obj in listing.objects] == [keys[3], keys[5]]
+    assert listing.safe_start_after == keys[2]
+
+    listing = s3_list_cdc_gz_objects("bucket", prefix, min_ts="20240102-000000001", start_after=keys[0])
+    assert [obj.key for obj in listing.objects] == [keys[3], keys[5]]
+    assert listing.safe_start_after == keys[2]
+
+    listing = s3_list_cdc_gz_objects("bucket", prefix, min_ts="20240104-000000001", start_after=keys[2])
+    assert not listing.objects
+    assert listing.safe_start_after == keys[5]
@@ -0,0 +1,35 @@
+from cubic_loader.qlik.rds_utils import merge_from_temp
+
+
+def test_merge_from_temp() -> None:
+    """
+    assert MERGE query of final state cdc records
+    """
+    merge_query = merge_from_temp(
+        "ods.table",
+        "ods.table_tmp",
+        ["id", "other_id", "value", "note"],
+        [("=", "id"), ("IS NOT DISTINCT FROM", "other_id")],
+    )
+
+    assert merge_query == (
+        "MERGE INTO ods.table AS f USING ods.table_tmp AS s ON f.id = s.id AND f.other_id IS NOT DISTINCT FROM s.other_id "
+        "WHEN MATCHED AND s.header__change_oper = 'D' THEN DELETE "
+        "WHEN MATCHED AND s.header__change_oper = 'I' THEN UPDATE SET value=s.value,note=s.note "
+        "WHEN MATCHED THEN UPDATE SET value=COALESCE(s.value,f.value),note=COALESCE(s.note,f.note) "
+        "WHEN NOT MATCHED AND s.header__change_oper = 'I' THEN INSERT (id,other_id,value,note) "
+        "VALUES (s.id,s.other_id,s.value,s.note);"
+    )
+
+
+def test_merge_from_temp_keys_only() -> None:
+    """
+    assert that MERGE query of table without non-key columns only DELETEs and INSERTs
+    """
+    merge_query = merge_from_temp("ods.table", "ods.table_tmp", ["id"], [("=", "id")])
+
+    assert merge_query == (
+        "MERGE INTO ods.table AS f USING ods.table_tmp AS s ON f.id = s.id "
+        "WHEN MATCHED AND s.header__change_oper = 'D' THEN DELETE "
+        "WHEN NOT MATCHED AND s.header__change_oper = 'I' THEN INSERT (id) VALUES (s.id);"
+    )